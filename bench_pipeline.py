@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+import planner
+import polyline
+import map_layers
+import google_apis
+import spatial_index
+import location_store
+from bench_polyline import best_time
+from route_fixtures import ROUTES, synthetic_route
+
+SEARCH_DISTANCE = 30  # kms
+REGRESSION_THRESHOLD = 1.25  # slower than the last recorded run by this factor
+DATASET_JITTER_DEG = 0.2
+
+def scaled_dataset(csv_path, scale, out_dir, seed=0):
+    # `scale` copies of the csv, every copy after the first nudged by up to
+    # DATASET_JITTER_DEG so the extra rows spread out like real locations
+    ddds = pd.read_csv(csv_path, dtype=str)
+    path = os.path.join(out_dir, f'ddd_locations_x{scale}.csv')
+    if scale == 1:
+        shutil.copyfile(csv_path, path)
+        return path
+
+    rng = np.random.default_rng(seed)
+    lats = pd.to_numeric(ddds['latitude'], errors='coerce').to_numpy()
+    lons = pd.to_numeric(ddds['longitude'], errors='coerce').to_numpy()
+    copies = [ddds]
+    for _ in range(scale - 1):
+        jitter = rng.uniform(-DATASET_JITTER_DEG, DATASET_JITTER_DEG, size=(len(ddds), 2))
+        # rows without coordinates (ERROR) are copied as they are
+        copies.append(ddds.assign(
+            latitude=np.where(np.isnan(lats), ddds['latitude'], (lats + jitter[:, 0]).round(6).astype(str)),
+            longitude=np.where(np.isnan(lons), ddds['longitude'], (lons + jitter[:, 1]).round(6).astype(str)),
+        ))
+    pd.concat(copies, ignore_index=True).to_csv(path, index=False)
+    return path
+
+def cold_load(csv_path):
+    # load_ddds from nothing: no cached frame and no store or index on disk
+    for path in (location_store.store_path_for(csv_path), location_store.categories_path_for(csv_path),
+                 spatial_index.index_path_for(csv_path)):
+        if os.path.exists(path):
+            os.remove(path)
+    location_store._loaded.pop(os.path.abspath(csv_path), None)
+    return location_store.load_ddds(csv_path)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def uncached(func):
+    # time the search itself rather than a planner.result_cache hit
+    def run():
+        planner.result_cache.clear()
+        return func()
+    return run
+
+def bench_dataset(csv_path, scale, repeat):
+    # (stage, route, seconds, extra) rows for one dataset size
+    results = []
+    results.append(('load_ddds_cold', None, best_time(lambda: cold_load(csv_path), repeat=repeat), {}))
+    results.append(('load_ddds_warm', None, best_time(lambda: location_store.load_ddds(csv_path), repeat=repeat), {}))
+    ddds, ddd_index = location_store.load_ddds(csv_path)
+
+    for name, waypoints in ROUTES.items():
+        route = synthetic_route(waypoints)
+        encoded = polyline.encode(route)
+        route_points = google_apis.decode_polyline(encoded)
+        window = planner.calc_filter_window(route_points, SEARCH_DISTANCE)
+        found = planner.find_ddds_along_route(ddds, route_points, window, SEARCH_DISTANCE, ddd_index)
+        extra = {'route_points': len(route_points), 'ddds': len(ddds), 'found': len(found)}
+
+        results.append(('decode_polyline', name, best_time(lambda: google_apis.decode_polyline(encoded), repeat=repeat), extra))
+        results.append(('calc_filter_window', name, best_time(lambda: planner.calc_filter_window(route_points, SEARCH_DISTANCE), repeat=repeat), extra))
+        results.append(('find_ddds_along_route', name, best_time(uncached(
+            lambda: planner.find_ddds_along_route(ddds, route_points, window, SEARCH_DISTANCE, ddd_index)), repeat=repeat), extra))
+        results.append(('find_ddds_along_route_window', name, best_time(uncached(
+            lambda: planner.find_ddds_along_route(ddds, route_points, window, SEARCH_DISTANCE)), repeat=repeat), extra))
+        results.append(('find_ddds_along_route_cached', name, best_time(
+            lambda: planner.find_ddds_along_route(ddds, route_points, window, SEARCH_DISTANCE, ddd_index), repeat=repeat), extra))
+        results.append(('stream_first_batch', name, best_time(uncached(
+            lambda: next(planner.stream_ddds_along_route(ddds, route_points, planner.MAX_SEARCH_DISTANCE, ddd_index, simplified=False))),
+            repeat=repeat), extra))
+        results.append(('route_distance_field', name, best_time(uncached(
+            lambda: planner.route_distance_field(ddds, route_points, planner.MAX_SEARCH_DISTANCE, ddd_index)), repeat=repeat), extra))
+        results.append(('render_map_html', name, best_time(
+            lambda: map_layers.route_map(route_points, found.frame()).get_root().render(), repeat=repeat), extra))
+    return [
+        {'stage': stage, 'route': route, 'scale': scale, 'seconds': seconds, **extra}
+        for stage, route, seconds, extra in results
+    ]
+
+def result_key(result):
+    return result['stage'], result['route'], result['scale']
+
+def load_previous(record_path):
+    # the most recent recorded time for every (stage, route, scale)
+    previous = {}
+    if os.path.exists(record_path):
+        with open(record_path) as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    previous[result_key(result)] = result
+    return previous
+
+def main():
+    parser = argparse.ArgumentParser(description='Time each stage of the route -> corridor -> map pipeline.')
+    parser.add_argument('--csv', default='ddd_locations.csv')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 50], help='dataset size multiples')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--record', default='bench_results.jsonl', help='results are appended here and compared to the last run')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--corridor-workers', type=int, default=None, help='threads for tiled corridor searches')
+    args = parser.parse_args()
+    if args.corridor_workers:
+        planner.CORRIDOR_WORKERS = args.corridor_workers
+
+    previous = load_previous(args.record)
+    run = {'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': git_revision()}
+    regressions = []
+    out_dir = tempfile.mkdtemp(prefix='ddd_bench_')
+    try:
+        with open(args.record, 'a') as record:
+            print(f"{'stage':<30} {'route':<15} {'scale':>5} {'ms':>10} {'prev ms':>10}")
+            for scale in args.scales:
+                csv_path = scaled_dataset(args.csv, scale, out_dir)
+                for result in bench_dataset(csv_path, scale, args.repeat):
+                    before = previous.get(result_key(result))
+                    prev_ms = f"{before['seconds'] * 1000:>10.2f}" if before else f"{'-':>10}"
+                    flag = ''
+                    if before and result['seconds'] > before['seconds'] * args.threshold:
+                        flag = '  REGRESSION'
+                        regressions.append(result)
+                    print(f"{result['stage']:<30} {result['route'] or '':<15} {scale:>5} {result['seconds'] * 1000:>10.2f} {prev_ms}{flag}")
+                    record.write(json.dumps({**run, **result}) + '\n')
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    if regressions:
+        print(len(regressions), f'stage(s) slower than {args.threshold}x the last recorded run')
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
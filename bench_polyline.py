@@ -0,0 +1,60 @@
+import sys
+import timeit
+import numpy as np
+import polyline
+
+def legacy_decode_polyline(polyline_str):
+    # the character-at-a-time decoder google_apis used before polyline.py
+    index, lat, lng = 0, 0, 0
+    coordinates = []
+    changes = {'latitude': 0, 'longitude': 0}
+
+    while index < len(polyline_str):
+        for unit in ['latitude', 'longitude']:
+            shift, result = 0, 0
+
+            while True:
+                byte = ord(polyline_str[index]) - 63
+                index+=1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if not byte >= 0x20:
+                    break
+
+            if (result & 1):
+                changes[unit] = ~(result >> 1)
+            else:
+                changes[unit] = (result >> 1)
+
+        lat += changes['latitude']
+        lng += changes['longitude']
+
+        coordinates.append((lat / 100000.0, lng / 100000.0))
+
+    return coordinates
+
+def synthetic_route(n_points, seed=0):
+    # a wandering road heading roughly east from southern california
+    rng = np.random.default_rng(seed)
+    steps = rng.normal([0.0, 0.01], 0.004, size=(n_points, 2))
+    return np.cumsum(steps, axis=0) + [34.05, -118.25]
+
+def best_time(func, repeat=5):
+    number, _ = timeit.Timer(func).autorange()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+def main(sizes=(1_000, 5_000, 20_000), n_steps=200):
+    print(f"{'points':>8} {'legacy pts/s':>14} {'decode pts/s':>14} {'speedup':>8} {'decode_many pts/s':>18}")
+    for n_points in sizes:
+        route = synthetic_route(n_points)
+        encoded = polyline.encode(route)
+        steps = [polyline.encode(step) for step in np.array_split(route, n_steps)]
+
+        assert np.allclose(polyline.decode(encoded), legacy_decode_polyline(encoded))
+        legacy = best_time(lambda: legacy_decode_polyline(encoded))
+        fast = best_time(lambda: polyline.decode(encoded))
+        many = best_time(lambda: polyline.decode_many(steps))
+        print(f"{n_points:>8} {n_points / legacy:>14,.0f} {n_points / fast:>14,.0f} {legacy / fast:>7.1f}x {n_points / many:>18,.0f}")
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (1_000, 5_000, 20_000))
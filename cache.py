@@ -0,0 +1,135 @@
+import time
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+class LRUCache:
+    # in-memory cache holding at most maxsize entries, each for at most ttl seconds
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (None if ttl is None else time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+class DiskCache:
+    # pickled values in a sqlite file; expired rows are skipped on read and purged on write
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)')
+
+    @contextmanager
+    def _connect(self):
+        # a connection per call keeps this safe to use from streamlit's script threads
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value), None if ttl is None else now + ttl))
+
+    def get_many(self, keys):
+        # {key: value} for the keys that are cached and not expired
+        keys = list(keys)
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f'SELECT key, value FROM cache WHERE key IN ({",".join("?" * len(chunk))}) '
+                    'AND (expires_at IS NULL OR expires_at > ?)',
+                    (*chunk, time.time())).fetchall()
+                found.update((key, pickle.loads(value)) for key, value in rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache')
+
+class TieredCache:
+    # an LRUCache in front of a DiskCache; disk hits are promoted into memory
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+            return value
+        return default
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def stats(self):
+        return {
+            'memory_hits': self.memory.hits,
+            'disk_hits': self.disk.hits,
+            'misses': self.disk.misses,
+            'memory_entries': len(self.memory),
+        }
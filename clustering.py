@@ -0,0 +1,79 @@
+import math
+import numpy as np
+
+TILE_PX = 256
+
+def _to_world(lats, lons):
+    # web mercator "world" coordinates in [0, 1); x grows east, y grows south
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -85.0511, 85.0511)
+    x = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+def _from_world(x, y):
+    lons = x * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * y))))
+    return lats, lons
+
+class ClusterLevel:
+    # clusters for one zoom, sorted by longitude so a viewport is a binary search
+    def __init__(self, lats, lons, counts, members):
+        order = np.argsort(lons, kind='stable')
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.counts = counts[order]
+        # row index of the location for single-point clusters, -1 for real clusters
+        self.members = members[order]
+
+    def in_bounds(self, south, west, north, east):
+        start = np.searchsorted(self.lons, west, side='left')
+        stop = np.searchsorted(self.lons, east, side='right')
+        lats = self.lats[start:stop]
+        hit = start + np.flatnonzero((lats >= south) & (lats <= north))
+        return {
+            'latitude': self.lats[hit],
+            'longitude': self.lons[hit],
+            'count': self.counts[hit],
+            'member': self.members[hit],
+        }
+
+class ClusterHierarchy:
+    # grid clustering of every location at each zoom 0..max_zoom, built once per
+    # dataset. at a zoom, locations sharing a cell_px x cell_px screen cell merge
+    # into one cluster placed at their mean position; past max_zoom every location
+    # is its own point. a pan or zoom then only costs a lookup in one level.
+    def __init__(self, lats, lons, max_zoom=14, cell_px=60):
+        self.max_zoom = max_zoom
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        x, y = _to_world(lats, lons)
+
+        self.levels = []
+        for zoom in range(max_zoom + 1):
+            cell = cell_px / (TILE_PX * 2**zoom)
+            n_cells = int(math.ceil(1 / cell))
+            keys = np.floor(y / cell).astype(np.int64) * n_cells + np.floor(x / cell).astype(np.int64)
+            _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            mean_x = np.bincount(inverse, weights=x) / counts
+            mean_y = np.bincount(inverse, weights=y) / counts
+            cluster_lats, cluster_lons = _from_world(mean_x, mean_y)
+
+            members = np.full(len(counts), -1, dtype=np.int64)
+            single = counts[inverse] == 1
+            members[inverse[single]] = np.flatnonzero(single)
+            self.levels.append(ClusterLevel(cluster_lats, cluster_lons, counts, members))
+
+        self.points = ClusterLevel(lats, lons, np.ones(len(lats), dtype=np.int64), np.arange(len(lats)))
+
+    def query(self, bounds, zoom):
+        # clusters and single points inside bounds ((south, west), (north, east)) at zoom
+        (south, west), (north, east) = bounds
+        zoom = int(math.floor(zoom))
+        level = self.points if zoom > self.max_zoom else self.levels[max(zoom, 0)]
+        if west <= east:
+            return level.in_bounds(south, west, north, east)
+        # viewport crossing the antimeridian
+        left = level.in_bounds(south, west, north, 180.0)
+        right = level.in_bounds(south, -180.0, north, east)
+        return {name: np.concatenate([left[name], right[name]]) for name in left}
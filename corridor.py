@@ -0,0 +1,172 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.0
+
+def to_unit_vectors(points):
+    # (n, 2) lat/lon degrees -> (n, 3) points on the unit sphere
+    points = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    lat, lon = points[:, 0], points[:, 1]
+    return np.c_[np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+
+def segment_lengths(route_points):
+    # great-circle length in kms of each route segment
+    xyz = to_unit_vectors(route_points)
+    chord = np.linalg.norm(xyz[1:] - xyz[:-1], axis=1)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+class RouteGeometry:
+    # a route's vertices and the cumulative km at each, built once per route.
+    # positions along the route are then binary searches on cum_km instead of
+    # another pass over the route per location.
+    def __init__(self, route_points):
+        self.points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+        self.cum_km = np.concatenate([[0.0], np.cumsum(segment_lengths(self.points))])
+        self.total_km = float(self.cum_km[-1])
+
+    def from_vertices(self, vertices, km):
+        # kms along the route through just these vertices (the ones a simplified
+        # route kept) -> kms along this route. each kept stretch is scaled to the
+        # length of the full route between its ends, so order is preserved and
+        # the kept vertices land exactly.
+        km = np.asarray(km, dtype=np.float64)
+        if len(vertices) < 2:
+            return np.zeros_like(km)
+        sub_km = np.concatenate([[0.0], np.cumsum(segment_lengths(self.points[vertices]))])
+        return np.interp(km, sub_km, self.cum_km[vertices])
+
+def _segment_block_distances(a, b, seg_angles, p):
+    # distance (radians) from every point p to every great-circle segment a->b and
+    # the along-segment angle of the closest point; result shapes are (segments, points)
+    normals = np.cross(a, b)
+    norm = np.linalg.norm(normals, axis=1)
+    degenerate = norm < 1e-12
+    normals = normals / np.where(degenerate, 1.0, norm)[:, None]
+
+    cross_track = np.arcsin(np.clip(normals @ p.T, -1.0, 1.0))
+    along_track = np.arctan2(np.cross(normals, a) @ p.T, a @ p.T)
+    inside = (along_track >= 0) & (along_track <= seg_angles[:, None]) & ~degenerate[:, None]
+
+    to_a = 2 * np.arcsin(np.clip(np.linalg.norm(a[:, None, :] - p[None, :, :], axis=2) / 2, 0.0, 1.0))
+    to_b = 2 * np.arcsin(np.clip(np.linalg.norm(b[:, None, :] - p[None, :, :], axis=2) / 2, 0.0, 1.0))
+
+    dist = np.where(inside, np.abs(cross_track), np.minimum(to_a, to_b))
+    along = np.where(inside, along_track, np.where(to_a <= to_b, 0.0, seg_angles[:, None]))
+    return dist, along
+
+def box_pad(max_distance, seg_km):
+    # great-circle arcs bow away from the straight lat/lon box of their vertices
+    return max_distance + seg_km.max()**2 / (4 * EARTH_RADIUS_KM)
+
+def near_box(points, locations, pad):
+    # mask of locations inside the lat/lon box of points grown by pad kms
+    lat_lo, lat_hi = points[:, 0].min() - pad / KM_PER_DEG_LAT, points[:, 0].max() + pad / KM_PER_DEG_LAT
+    lon_pad = pad / (KM_PER_DEG_LAT * max(np.cos(np.radians(max(abs(lat_lo), abs(lat_hi)))), 0.01))
+    return (locations[:, 0] >= lat_lo) & (locations[:, 0] <= lat_hi) &\
+           (locations[:, 1] >= points[:, 1].min() - lon_pad) & (locations[:, 1] <= points[:, 1].max() + lon_pad)
+
+def corridor_search(route_points, locations, max_distance=None, block_size=256, max_cells=1_000_000):
+    # minimum great-circle distance in kms from each location to the route polyline
+    # (segments, not just vertices) and the along-route position in kms of the
+    # closest point. when max_distance is given, segments are handled in blocks and
+    # each block only measures locations inside its bounding box grown by
+    # max_distance; locations further away than that are left at inf / nan.
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+
+    min_dists = np.full(len(locations), np.inf)
+    route_km = np.full(len(locations), np.nan)
+    if len(route_points) == 0 or len(locations) == 0:
+        return min_dists, route_km
+    if len(route_points) == 1:
+        route_points = np.vstack([route_points, route_points])
+
+    xyz = to_unit_vectors(route_points)
+    loc_xyz = to_unit_vectors(locations)
+    seg_km = segment_lengths(route_points)
+    seg_angles = seg_km / EARTH_RADIUS_KM
+    seg_start_km = np.concatenate([[0.0], np.cumsum(seg_km)[:-1]])
+
+    if max_distance is not None:
+        pad = box_pad(max_distance, seg_km)
+
+    n_segs = len(seg_km)
+    for start in range(0, n_segs, block_size):
+        stop = min(start + block_size, n_segs)
+        if max_distance is None:
+            cand = np.arange(len(locations))
+        else:
+            cand = np.flatnonzero(near_box(route_points[start:stop + 1], locations, pad))
+        if len(cand) == 0:
+            continue
+
+        # keep each (segments x locations) slab under max_cells
+        step = max(1, max_cells // ((stop - start) * 3))
+        for cstart in range(0, len(cand), step):
+            c = cand[cstart:cstart + step]
+            dist, along = _segment_block_distances(
+                xyz[start:stop], xyz[start + 1:stop + 1], seg_angles[start:stop], loc_xyz[c])
+            best = dist.argmin(axis=0)
+            cols = np.arange(len(c))
+            best_km = dist[best, cols] * EARTH_RADIUS_KM
+            closer = best_km < min_dists[c]
+            min_dists[c[closer]] = best_km[closer]
+            route_km[c[closer]] = (seg_start_km[start + best] + along[best, cols] * EARTH_RADIUS_KM)[closer]
+
+    if max_distance is not None:
+        too_far = min_dists > max_distance
+        min_dists[too_far] = np.inf
+        route_km[too_far] = np.nan
+    return min_dists, route_km
+
+def route_tiles(n_points, n_tiles):
+    # (start, stop) vertex ranges cutting a route into n_tiles runs of segments;
+    # neighbouring tiles share their boundary vertex so no segment is lost
+    bounds = np.unique(np.linspace(0, n_points - 1, n_tiles + 1).round().astype(int))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _tile_search(job):
+    tile_points, tile_locations, max_distance = job
+    return corridor_search(tile_points, tile_locations, max_distance)
+
+def tiled_corridor_search(route_points, locations, max_distance, n_tiles=None, executor=None):
+    # corridor_search run as n_tiles pieces of the route in parallel, each only
+    # measuring the locations near its own stretch. executor can be any
+    # concurrent.futures pool (numpy releases the gil, so threads scale too);
+    # without one a thread pool of n_tiles workers is used for the call. a
+    # location near several tiles keeps its closest one, so the result is the
+    # same as corridor_search's, route kms included.
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    n_tiles = n_tiles or os.cpu_count() or 1
+    if n_tiles < 2 or len(route_points) < 3 or len(locations) == 0:
+        return corridor_search(route_points, locations, max_distance)
+
+    seg_km = segment_lengths(route_points)
+    cum_km = np.concatenate([[0.0], np.cumsum(seg_km)])
+    pad = box_pad(max_distance, seg_km)
+    tiles, jobs = [], []
+    for start, stop in route_tiles(len(route_points), n_tiles):
+        tile_points = route_points[start:stop + 1]
+        cand = np.flatnonzero(near_box(tile_points, locations, pad))
+        if len(cand):
+            tiles.append((cum_km[start], cand))
+            jobs.append((tile_points, locations[cand], max_distance))
+
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=len(jobs) or 1) as pool:
+            results = list(pool.map(_tile_search, jobs))
+    else:
+        results = list(executor.map(_tile_search, jobs))
+
+    min_dists = np.full(len(locations), np.inf)
+    route_km = np.full(len(locations), np.nan)
+    # tiles are merged in route order and only a strictly closer tile wins, so
+    # ties go to the earlier stretch as they do in corridor_search
+    for (offset, cand), (dists, kms) in zip(tiles, results):
+        closer = dists < min_dists[cand]
+        min_dists[cand[closer]] = dists[closer]
+        route_km[cand[closer]] = kms[closer] + offset
+    return min_dists, route_km
@@ -0,0 +1,116 @@
+import os
+import threading
+import numpy as np
+import corridor
+import google_apis
+import instrumentation
+from cache import LRUCache, DiskCache, TieredCache
+
+# added drive time for stopping at a ddd. the route is cut into stretches of
+# segment_km with an anchor point at each cut; a candidate near stretch k costs
+#     time(a -> ddd) + time(ddd -> b) - time(a -> b)
+# for that stretch's anchors a and b. times come from the distance matrix api,
+# batched per stretch: a -> [ddds..., b] in one request and [ddds...] -> b in
+# another, so a stretch with many candidates still costs two requests. answers
+# are cached per (stretch anchors, location).
+
+SEGMENT_KM = 50.0
+MAX_DIMENSION = 25  # origins or destinations per distance matrix request
+
+DETOUR_CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+
+# built by get_detour_cache() on first use, like google_apis.route_cache
+detour_cache = None
+_detour_cache_lock = threading.Lock()
+
+def get_detour_cache():
+    global detour_cache
+    with _detour_cache_lock:
+        if detour_cache is None:
+            detour_cache = TieredCache(
+                LRUCache(maxsize=4096, ttl=DETOUR_CACHE_TTL),
+                DiskCache(os.environ.get('DDD_DETOUR_CACHE', 'detour_cache.sqlite'), ttl=DETOUR_CACHE_TTL),
+            )
+            instrumentation.metrics.register_cache('detour', detour_cache)
+    return detour_cache
+
+def route_anchors(route_points, segment_km=SEGMENT_KM):
+    # points every segment_km along the route plus its end, and their route kms
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    cum_km = np.concatenate([[0.0], np.cumsum(corridor.segment_lengths(route_points))])
+    if cum_km[-1] > 0:
+        marks = np.append(np.arange(0.0, cum_km[-1], segment_km), cum_km[-1])
+    else:
+        marks = np.zeros(2)  # a route that goes nowhere is one empty stretch
+    anchors = np.c_[np.interp(marks, cum_km, route_points[:, 0]), np.interp(marks, cum_km, route_points[:, 1])]
+    return anchors, marks
+
+def cache_key(a, b, location):
+    return '|'.join(google_apis.format_latlng(point) for point in (a, b, location))
+
+def _stretch_detours(a, b, locations):
+    # (to, from, direct) seconds and meters for locations off the stretch a -> b;
+    # two requests per MAX_DIMENSION - 1 locations
+    to_s, from_s, to_m, from_m = (np.full(len(locations), np.nan) for _ in range(4))
+    direct_s = direct_m = np.nan
+    n_requests = 0
+    step = MAX_DIMENSION - 1
+    for start in range(0, len(locations), step):
+        chunk = locations[start:start + step]
+        durations, distances = google_apis.get_distance_matrix([a], list(chunk) + [b])
+        to_s[start:start + step], to_m[start:start + step] = durations[0, :-1], distances[0, :-1]
+        direct_s, direct_m = durations[0, -1], distances[0, -1]
+        durations, distances = google_apis.get_distance_matrix(chunk, [b])
+        from_s[start:start + step], from_m[start:start + step] = durations[:, 0], distances[:, 0]
+        n_requests += 2
+    return (to_s, from_s, direct_s, to_m, from_m, direct_m), n_requests
+
+@instrumentation.timed('detour')
+def rank_by_detour(route_points, ddds_in_range, top_n=10, max_requests=20, segment_km=SEGMENT_KM):
+    # ddds_in_range (with route_km and range, as from planner) plus detour_s and
+    # detour_km columns, cheapest detour first. only the top_n closest by range
+    # are looked up and at most max_requests distance matrix requests are made;
+    # rows left without an answer have nan detours and come last.
+    detour_s = np.full(len(ddds_in_range), np.nan)
+    detour_km = np.full(len(ddds_in_range), np.nan)
+    trace = instrumentation.current()
+
+    if len(ddds_in_range) > 0 and len(route_points) > 0:
+        anchors, marks = route_anchors(route_points, segment_km)
+        chosen = np.argsort(ddds_in_range['range'].to_numpy(), kind='stable')[:top_n]
+        locations = ddds_in_range[['latitude', 'longitude']].to_numpy(dtype=np.float64)
+        stretch = np.clip(np.searchsorted(marks, ddds_in_range['route_km'].to_numpy(), side='right') - 1, 0, len(marks) - 2)
+
+        cache = get_detour_cache()
+        misses = {}  # stretch -> rows without a cached answer
+        for row in chosen:
+            k = stretch[row]
+            cached = cache.get(cache_key(anchors[k], anchors[k + 1], locations[row]))
+            trace.cache_lookup('detour', cached is not None)
+            if cached is None:
+                misses.setdefault(k, []).append(row)
+            else:
+                to_s, from_s, direct_s, to_m, from_m, direct_m = cached
+                detour_s[row] = to_s + from_s - direct_s
+                detour_km[row] = (to_m + from_m - direct_m) / 1000
+
+        n_requests = 0
+        for k, rows in sorted(misses.items()):
+            if n_requests + 2 > max_requests:
+                break
+            # a stretch needs 2 requests per chunk; keep to the budget
+            rows = rows[:(max_requests - n_requests) // 2 * (MAX_DIMENSION - 1)]
+            (to_s, from_s, direct_s, to_m, from_m, direct_m), used = _stretch_detours(
+                anchors[k], anchors[k + 1], locations[rows])
+            n_requests += used
+            for i, row in enumerate(rows):
+                answer = (to_s[i], from_s[i], direct_s, to_m[i], from_m[i], direct_m)
+                if np.all(np.isfinite(answer)):
+                    cache.set(cache_key(anchors[k], anchors[k + 1], locations[row]), tuple(float(x) for x in answer))
+                    detour_s[row] = to_s[i] + from_s[i] - direct_s
+                    detour_km[row] = (to_m[i] + from_m[i] - direct_m) / 1000
+        trace.count('detour_requests', n_requests)
+
+    # a stop can't save time; small negatives are the api's rounding
+    return ddds_in_range.assign(detour_s=np.maximum(detour_s, 0), detour_km=np.maximum(detour_km, 0))\
+        .sort_values(['detour_s', 'range'], na_position='last')
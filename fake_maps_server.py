@@ -0,0 +1,223 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import numpy as np
+import corridor
+import haversine
+import polyline
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from route_fixtures import synthetic_route
+from google_apis import normalize_address
+
+# a local stand-in for the google directions, geocoding and distance matrix web
+# services. answers come from a recordings file when it has one for the request
+# and are made up otherwise: every address geocodes to a fixed point in the lower
+# 48, routes are a wandering line between the two ends and drive times scale
+# with straight-line distance. latency and failures can be injected to see how
+# the app behaves when google is slow or flaky. point the app at it with
+# GOOGLE_MAPS_BASE_URL=http://host:port
+
+DIRECTIONS_PATH = '/maps/api/directions/json'
+GEOCODE_PATH = '/maps/api/geocode/json'
+DISTANCE_MATRIX_PATH = '/maps/api/distancematrix/json'
+ENDPOINTS = {DIRECTIONS_PATH: 'directions', GEOCODE_PATH: 'geocode', DISTANCE_MATRIX_PATH: 'distance_matrix'}
+SYNTHETIC_BOUNDS = (25.5, -123.5), (48.5, -70.5)  # sw, ne
+DRIVING_KMH = 90.0
+ROAD_FACTOR = 1.3  # synthetic road distance per great-circle km
+
+class Faults:
+    # every request waits latency_ms plus up to jitter_ms. then, in this order,
+    # error_rate of requests get an http 500, over_limit_rate an OVER_QUERY_LIMIT
+    # status and hang_rate stall for hang_seconds before answering normally
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, over_limit_rate=0.0,
+                 hang_rate=0.0, hang_seconds=15.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.over_limit_rate = over_limit_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        # (delay seconds, fault name or None) for one request
+        with self.lock:
+            delay = (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000.0
+            roll = self.random.random()
+        if roll < self.error_rate:
+            return delay, 'error'
+        roll -= self.error_rate
+        if roll < self.over_limit_rate:
+            return delay, 'over_limit'
+        roll -= self.over_limit_rate
+        if roll < self.hang_rate:
+            return delay + self.hang_seconds, 'hang'
+        return delay, None
+
+def load_recordings(path):
+    # {"directions": {"origin|destination": response}, "geocode": {"address": response}}
+    # with addresses as google_apis.normalize_address writes them
+    if path is None:
+        return {'directions': {}, 'geocode': {}}
+    with open(path) as f:
+        recordings = json.load(f)
+    return {'directions': recordings.get('directions', {}), 'geocode': recordings.get('geocode', {})}
+
+def synthetic_location(address):
+    # the same point for the same address, every time
+    digest = hashlib.sha256(normalize_address(address).encode('utf-8')).digest()
+    u, v = np.frombuffer(digest[:16], dtype=np.uint64) / float(2**64)
+    (south, west), (north, east) = SYNTHETIC_BOUNDS
+    return south + u * (north - south), west + v * (east - west)
+
+def synthetic_geocode(address):
+    if not address.strip():
+        return {'status': 'ZERO_RESULTS', 'results': []}
+    lat, lng = synthetic_location(address)
+    return {
+        'status': 'OK',
+        'results': [{'formatted_address': address, 'geometry': {'location': {'lat': lat, 'lng': lng}}}],
+    }
+
+def synthetic_directions(origin, destination, step):
+    if not origin.strip() or not destination.strip():
+        return {'status': 'ZERO_RESULTS', 'routes': []}
+    seed = int.from_bytes(hashlib.sha256((origin + '|' + destination).encode('utf-8')).digest()[:4], 'little')
+    route = synthetic_route([synthetic_location(origin), synthetic_location(destination)], step=step, seed=seed)
+    meters = float(corridor.segment_lengths(route).sum()) * 1000
+    return {
+        'status': 'OK',
+        'routes': [{
+            'overview_polyline': {'points': polyline.encode(route)},
+            'legs': [{
+                'distance': {'value': int(meters)},
+                'duration': {'value': int(meters / (DRIVING_KMH / 3.6))},
+            }],
+        }],
+    }
+
+def synthetic_distance_matrix(origins, destinations):
+    # road distance as ROAD_FACTOR x great-circle distance, at DRIVING_KMH
+    def parse(points):
+        return np.array([[float(value) for value in point.split(',')] for point in points.split('|') if point]).reshape(-1, 2)
+
+    origins, destinations = parse(origins), parse(destinations)
+    if len(origins) == 0 or len(destinations) == 0:
+        return {'status': 'INVALID_REQUEST', 'rows': []}
+    km = haversine.haversine_matrix(origins, destinations) * ROAD_FACTOR
+    return {
+        'status': 'OK',
+        'rows': [
+            {'elements': [
+                {'status': 'OK', 'distance': {'value': int(d * 1000)}, 'duration': {'value': int(d / DRIVING_KMH * 3600)}}
+                for d in row
+            ]}
+            for row in km
+        ],
+    }
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if url.path not in ENDPOINTS:
+            self.send_json(404, {'status': 'NOT_FOUND'})
+            return
+
+        delay, fault = self.server.faults.draw()
+        self.server.count(url.path, fault)
+        if delay:
+            time.sleep(delay)
+        if fault == 'error':
+            self.send_json(500, {'status': 'UNKNOWN_ERROR'})
+        elif fault == 'over_limit':
+            self.send_json(200, {'status': 'OVER_QUERY_LIMIT', 'results': [], 'routes': []})
+        elif url.path == DISTANCE_MATRIX_PATH:
+            self.send_json(200, synthetic_distance_matrix(params.get('origins', ''), params.get('destinations', '')))
+        elif url.path == DIRECTIONS_PATH:
+            origin, destination = params.get('origin', ''), params.get('destination', '')
+            key = normalize_address(origin) + '|' + normalize_address(destination)
+            recorded = self.server.recordings['directions'].get(key)
+            self.send_json(200, recorded or synthetic_directions(origin, destination, self.server.route_step))
+        else:
+            address = params.get('address', '')
+            recorded = self.server.recordings['geocode'].get(normalize_address(address))
+            self.send_json(200, recorded or synthetic_geocode(address))
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, faults=None, recordings=None, route_step=2.0, verbose=False):
+        super().__init__(address, StandInHandler)
+        self.faults = faults or Faults()
+        self.recordings = recordings or load_recordings(None)
+        self.route_step = route_step  # kms between synthetic route points
+        self.verbose = verbose
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, path, fault):
+        name = ENDPOINTS[path]
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+            if fault:
+                self.stats[fault] = self.stats.get(fault, 0) + 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+def start_server(host='127.0.0.1', port=0, **kwargs):
+    # run a StandInServer on a background thread; port 0 picks a free port
+    server = StandInServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the google directions and geocoding apis.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--recordings', default=None, help='json file of recorded responses')
+    parser.add_argument('--route-step', type=float, default=2.0, help='kms between synthetic route points')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of http 500s')
+    parser.add_argument('--over-limit-rate', type=float, default=0.0, help='fraction of OVER_QUERY_LIMIT answers')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='fraction of requests that stall')
+    parser.add_argument('--hang-seconds', type=float, default=15.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.over_limit_rate,
+                    args.hang_rate, args.hang_seconds, args.seed)
+    server = StandInServer((args.host, args.port), faults, load_recordings(args.recordings), args.route_step, args.verbose)
+    print('serving on', server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print('requests', server.stats, flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    # write to a temp file next to path and rename it into place on success, so
+    # readers see either the old file or the complete new one, never half of it
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(tmp_path, 0o644)  # mkstemp creates files readable by the owner only
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
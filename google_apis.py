@@ -1,81 +1,126 @@
 import os
 import json
+import logging
+import threading
 import urllib3
 import requests
+import numpy as np
 import haversine
+import polyline
+import instrumentation
+from cache import LRUCache, DiskCache, TieredCache
+from maps_client import MapsClient
 
-api_key = os.environ['GOOGLE_MAPS_API_KEY']
+logger = logging.getLogger('ddd.google_apis')
+
+# shared by every call; replace it to change endpoints, timeouts or retries.
+# the api key is read from GOOGLE_MAPS_API_KEY when a request is made
+client = MapsClient()
+
+ROUTE_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+
+# built by get_route_cache() on first use, so importing this module doesn't
+# create the sqlite file; assign a cache here to use that one instead
+route_cache = None
+_route_cache_lock = threading.Lock()
+
+def get_route_cache():
+    global route_cache
+    with _route_cache_lock:
+        if route_cache is None:
+            route_cache = TieredCache(
+                LRUCache(maxsize=256, ttl=ROUTE_CACHE_TTL),
+                DiskCache(os.environ.get('DDD_ROUTE_CACHE', 'route_cache.sqlite'), ttl=ROUTE_CACHE_TTL),
+            )
+            instrumentation.metrics.register_cache('route', route_cache)
+    return route_cache
+
+def normalize_address(address):
+    return ' '.join(address.lower().split())
 
 def get_route_points(start_address, end_address):
-    base_url = 'https://maps.googleapis.com/maps/api/directions/json'
+    # decoded points are cached per normalized (origin, destination); failed lookups are not
+    route_key = normalize_address(start_address) + '|' + normalize_address(end_address)
+    route_points = get_route_cache().get(route_key)
+    instrumentation.current().cache_lookup('route', route_points is not None)
+    if route_points is not None:
+        return route_points
+
     params = {
         'origin': start_address,
         'destination': end_address,
-        'key': api_key
     }
-    
-    print('requesting route...')
-    response = requests.get(base_url, params=params)
-    data = response.json()
-    print('got response.')
+
+    logger.debug('requesting route')
+    try:
+        with instrumentation.current().stage('route_fetch'):
+            data = client.get_json('/maps/api/directions/json', params)
+    except requests.RequestException as e:
+        logger.warning('directions request failed: %s', e)
+        return []
 
     if data['status'] == 'OK':
         overview_polyline = data['routes'][0]['overview_polyline']['points']
         route_points = decode_polyline(overview_polyline)
+        get_route_cache().set(route_key, route_points)
         return route_points
     else:
-        print("Directions request failed. Status:", data['status'], flush=True)
+        logger.warning('directions request failed, status %s', data['status'])
         return []
 
 def get_lat_lon(address):
-    base_url = 'https://maps.googleapis.com/maps/api/geocode/json'
     params = {
         'address': address,
-        'key': api_key
     }
-    response = requests.get(base_url, params=params)
-    data = response.json()
+    try:
+        data = client.get_json('/maps/api/geocode/json', params)
+    except requests.RequestException as e:
+        logger.warning('geocoding failed: %s', e)
+        return (None, None)
     if data['status'] == 'OK':
         point = data['results'][0]['geometry']['location']
         latitude = point['lat']
         longitude = point['lng']
         return (latitude, longitude)
     else:
-        print("Geocoding failed. Status:", data['status'])
+        logger.warning('geocoding failed, status %s', data['status'])
         return (None, None)
 
+def format_latlng(point):
+    return f'{point[0]:.6f},{point[1]:.6f}'
+
+def get_distance_matrix(origins, destinations):
+    # driving (seconds, meters) arrays of shape (len(origins), len(destinations))
+    # for (lat, lon) origins and destinations, nan where google has no answer.
+    # one request; google allows at most 25 origins, 25 destinations and 100
+    # elements per request, so callers batch within that.
+    shape = (len(origins), len(destinations))
+    durations, distances = np.full(shape, np.nan), np.full(shape, np.nan)
+    params = {
+        'origins': '|'.join(format_latlng(point) for point in origins),
+        'destinations': '|'.join(format_latlng(point) for point in destinations),
+        'mode': 'driving',
+    }
+    try:
+        data = client.get_json('/maps/api/distancematrix/json', params)
+    except requests.RequestException as e:
+        logger.warning('distance matrix request failed: %s', e)
+        return durations, distances
+    if data['status'] != 'OK':
+        logger.warning('distance matrix request failed, status %s', data['status'])
+        return durations, distances
+
+    for i, row in enumerate(data['rows']):
+        for j, element in enumerate(row['elements']):
+            if element.get('status') == 'OK':
+                durations[i, j] = element['duration']['value']
+                distances[i, j] = element['distance']['value']
+    return durations, distances
+
+@instrumentation.timed('decode')
 def decode_polyline(polyline_str):
-    index, lat, lng = 0, 0, 0
-    coordinates = []
-    changes = {'latitude': 0, 'longitude': 0}
-
-    # Coordinates have variable length when encoded, so just keep
-    # track of whether we've hit the end of the string. In each
-    # while loop iteration, a single coordinate is decoded.
-    while index < len(polyline_str):
-        # Gather lat/lon changes, store them in a dictionary to apply them later
-        for unit in ['latitude', 'longitude']: 
-            shift, result = 0, 0
-
-            while True:
-                byte = ord(polyline_str[index]) - 63
-                index+=1
-                result |= (byte & 0x1f) << shift
-                shift += 5
-                if not byte >= 0x20:
-                    break
-
-            if (result & 1):
-                changes[unit] = ~(result >> 1)
-            else:
-                changes[unit] = (result >> 1)
-
-        lat += changes['latitude']
-        lng += changes['longitude']
-
-        coordinates.append((lat / 100000.0, lng / 100000.0))
-
-    return coordinates
+    # (n, 2) float64 array of (lat, lon); see polyline.py for the codec
+    return polyline.decode(polyline_str)
 
 if __name__ == "__main__":
     start_address = 'yamunanagar, India'
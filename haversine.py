@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 def haversine_distance(pt1, pt2):
     r = 6371.0  # Earth's radius in kilometers
@@ -20,6 +21,19 @@ def haversine_distance(pt1, pt2):
     distance = r * c  # Distance in kilometers
     return distance
 
+def haversine_matrix(pts1, pts2):
+    # pairwise distances in kms between every row of pts1 and every row of pts2,
+    # both (n, 2) arrays of (lat, lon) in degrees; result has shape (len(pts1), len(pts2))
+    r = 6371.0
+
+    pts1 = np.radians(np.asarray(pts1, dtype=np.float64).reshape(-1, 2))
+    pts2 = np.radians(np.asarray(pts2, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = pts1[:, 0:1], pts1[:, 1:2]
+    lat2, lon2 = pts2[:, 0], pts2[:, 1]
+
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * r * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
 # Example coordinates for two points
 lat1 = 52.5200  # Latitude of point 1 (Berlin, Germany)
 lon1 = 13.4050  # Longitude of point 1
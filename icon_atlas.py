@@ -0,0 +1,40 @@
+'https://icons8.com'
+
+import base64
+import functools
+
+folder_path = 'icons/'
+atlas_path = folder_path + 'atlas.png'
+
+# same icons base64_encoder.py inlines, laid out left to right in one image
+avail_dict = {
+    'in_range': 'red_d.png',
+    'out_of_range': 'grey_d.png',
+    'test': 'red_d_clear.png'
+}
+icon_px = 67  # every source icon is 67x67
+
+def icon_mapping():
+    # pydeck IconLayer icon_mapping: where each named icon sits in the atlas
+    return {
+        category: {'x': i * icon_px, 'y': 0, 'width': icon_px, 'height': icon_px, 'anchorY': icon_px}
+        for i, category in enumerate(avail_dict)
+    }
+
+@functools.lru_cache(maxsize=None)
+def atlas_url():
+    # the atlas as a data url, encoded once per process and sent once per deck
+    with open(atlas_path, 'rb') as f:
+        return 'data:image/png;base64,' + base64.b64encode(f.read()).decode('utf-8')
+
+def build_atlas():
+    from PIL import Image
+
+    atlas = Image.new('RGBA', (icon_px * len(avail_dict), icon_px))
+    for i, icon_filename in enumerate(avail_dict.values()):
+        with Image.open(folder_path + icon_filename) as icon:
+            atlas.paste(icon.convert('RGBA'), (i * icon_px, 0))
+    atlas.save(atlas_path, optimize=True)
+
+if __name__ == "__main__":
+    build_atlas()
@@ -0,0 +1,262 @@
+import json
+import time
+import functools
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# per-request stage timings, counts and cache hits. a Trace is started for each
+# request (an app rerun, a planned trip) and made current for the thread, so
+# code deep in the call stack records into it with current() without it being
+# passed around. when no trace is active current() returns one that records
+# nothing. finished traces are logged as one json line and added to the
+# process-wide metrics, which can be served in the prometheus text format.
+# configure_logging() makes every 'ddd' logger write json lines tagged with the
+# current trace id.
+
+logger = logging.getLogger('ddd.requests')
+
+# seconds
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar('ddd_trace', default=None)
+
+class Trace:
+    def __init__(self, name='request', session_id=None):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.stages = {}  # name -> seconds, summed over repeats
+        self.counts = {}
+        self.cache = {}  # name -> {'hit': n, 'miss': n}
+        self.started = time.perf_counter()
+        self.total = None
+        self._token = None
+
+    @contextmanager
+    def stage(self, name):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - began
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def cache_lookup(self, name, hit):
+        results = self.cache.setdefault(name, {'hit': 0, 'miss': 0})
+        results['hit' if hit else 'miss'] += 1
+
+    def to_dict(self):
+        return {
+            'event': self.name,
+            'trace_id': self.trace_id,
+            'session_id': self.session_id,
+            'total_ms': round(1000 * (self.total if self.total is not None else time.perf_counter() - self.started), 3),
+            'stages_ms': {name: round(1000 * seconds, 3) for name, seconds in self.stages.items()},
+            'counts': dict(self.counts),
+            'cache': {name: dict(results) for name, results in self.cache.items()},
+        }
+
+    def finish(self):
+        # stop the clock, log the trace, add it to the metrics and stop being current
+        if self.total is not None:
+            return self
+        self.total = time.perf_counter() - self.started
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        logger.info('%s finished', self.name, extra={'trace': self.to_dict()})
+        metrics.observe(self)
+        return self
+
+class _NullTrace:
+    # what current() returns outside a trace
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, n):
+        pass
+
+    def cache_lookup(self, name, hit):
+        pass
+
+_null_trace = _NullTrace()
+
+def start_trace(name='request', session_id=None):
+    trace = Trace(name, session_id)
+    trace._token = _current.set(trace)
+    return trace
+
+def current():
+    trace = _current.get()
+    return _null_trace if trace is None else trace
+
+class Metrics:
+    # counters and histograms over every finished trace in this process
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.requests = {}  # event -> n
+        self.stage_buckets = {}  # stage -> per-bucket counts
+        self.stage_sum = {}
+        self.stage_count = {}
+        self.items = {}  # count name -> total
+        self.cache = {}  # (cache, result) -> n
+        self.caches = {}  # name -> shared cache with a stats() method
+
+    def register_cache(self, name, cache):
+        # a process-wide cache whose stats() are reported with the metrics
+        with self.lock:
+            self.caches[name] = cache
+
+    def cache_stats(self):
+        with self.lock:
+            caches = dict(self.caches)
+        return {name: cache.stats() for name, cache in sorted(caches.items())}
+
+    def observe(self, trace):
+        with self.lock:
+            self.requests[trace.name] = self.requests.get(trace.name, 0) + 1
+            for name, seconds in list(trace.stages.items()) + [('total', trace.total)]:
+                counts = self.stage_buckets.setdefault(name, [0] * len(self.buckets))
+                for i, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        counts[i] += 1
+                self.stage_sum[name] = self.stage_sum.get(name, 0.0) + seconds
+                self.stage_count[name] = self.stage_count.get(name, 0) + 1
+            for name, n in trace.counts.items():
+                self.items[name] = self.items.get(name, 0) + n
+            for name, results in trace.cache.items():
+                for result, n in results.items():
+                    self.cache[name, result] = self.cache.get((name, result), 0) + n
+
+    def prometheus_text(self):
+        cache_stats = self.cache_stats()
+        with self.lock:
+            lines = [
+                '# HELP ddd_requests_total Finished traces by event.',
+                '# TYPE ddd_requests_total counter',
+            ]
+            lines += [f'ddd_requests_total{{event="{name}"}} {n}' for name, n in sorted(self.requests.items())]
+            lines += [
+                '# HELP ddd_stage_seconds Time spent in each stage of a request.',
+                '# TYPE ddd_stage_seconds histogram',
+            ]
+            for name in sorted(self.stage_buckets):
+                for bound, n in zip(self.buckets, self.stage_buckets[name]):
+                    lines.append(f'ddd_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {n}')
+                lines.append(f'ddd_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {self.stage_count[name]}')
+                lines.append(f'ddd_stage_seconds_sum{{stage="{name}"}} {self.stage_sum[name]:.6f}')
+                lines.append(f'ddd_stage_seconds_count{{stage="{name}"}} {self.stage_count[name]}')
+            lines += [
+                '# HELP ddd_items_total Items counted by requests, e.g. corridor candidates.',
+                '# TYPE ddd_items_total counter',
+            ]
+            lines += [f'ddd_items_total{{name="{name}"}} {n}' for name, n in sorted(self.items.items())]
+            lines += [
+                '# HELP ddd_cache_lookups_total Cache lookups by cache and result.',
+                '# TYPE ddd_cache_lookups_total counter',
+            ]
+            lines += [f'ddd_cache_lookups_total{{cache="{name}",result="{result}"}} {n}'
+                      for (name, result), n in sorted(self.cache.items())]
+            lines += [
+                '# HELP ddd_cache_stats Hits, misses and entries of the shared caches since the process started.',
+                '# TYPE ddd_cache_stats gauge',
+            ]
+            lines += [f'ddd_cache_stats{{cache="{name}",stat="{stat}"}} {n}'
+                      for name, stats in cache_stats.items() for stat, n in stats.items()]
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def timed(stage_name):
+    # decorator: time every call as stage_name of the current trace
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with current().stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class JsonFormatter(logging.Formatter):
+    # one json object per record; records logged inside a trace carry its ids and
+    # a finished trace's record carries the whole trace
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        trace = _current.get()
+        if trace is not None:
+            entry['trace_id'] = trace.trace_id
+            entry['session_id'] = trace.session_id
+        entry.update(getattr(record, 'trace', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(level=logging.INFO):
+    # send the 'ddd' loggers to stderr as json lines, once per process
+    ddd_logger = logging.getLogger('ddd')
+    if not ddd_logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        ddd_logger.addHandler(handler)
+        ddd_logger.propagate = False
+    ddd_logger.setLevel(level)
+
+def render_sidebar(trace):
+    # the optional timings panel for the streamlit apps
+    import streamlit as st
+
+    data = trace.to_dict()
+    st.sidebar.subheader('Timings')
+    st.sidebar.caption(f"trace {data['trace_id']}, {data['total_ms']:.1f} ms total")
+    if data['stages_ms']:
+        st.sidebar.table({'stage': list(data['stages_ms']), 'ms': [f'{ms:.1f}' for ms in data['stages_ms'].values()]})
+    if data['counts'] or data['cache']:
+        st.sidebar.json({'counts': data['counts'], 'cache': data['cache']})
+    caches = metrics.cache_stats()
+    if caches:
+        st.sidebar.caption('shared caches')
+        st.sidebar.json(caches)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        payload = metrics.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+def serve_metrics(port, host='127.0.0.1'):
+    # serve /metrics on a background thread; later calls reuse the first server,
+    # so a streamlit script can call this on every rerun. only local scrapers can
+    # reach it unless a wider host such as '0.0.0.0' is passed
+    global _metrics_server
+    with _metrics_lock:
+        if _metrics_server is None:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _metrics_server = server
+    return _metrics_server
@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import numpy as np
+import planner
+import google_apis
+import location_store
+import subprocess
+from cache import LRUCache, DiskCache, TieredCache
+from maps_client import MapsClient
+from concurrent.futures import ThreadPoolExecutor
+
+# drives many simulated app sessions against the stand-in maps server (started
+# as its own process unless --base-url is given, so its threads don't compete
+# with the sessions for the gil) and reports end-to-end planning latency
+# percentiles and throughput. sessions are threads in one process, the way
+# streamlit runs them. --mode plan plans each trip with planner.plan_trip;
+# --mode stream searches it the way new_app does, streaming
+# planner.stream_ddds_along_route over the whole distance field, and also
+# reports how long the first batch took.
+
+PERCENTILES = (50, 95, 99)
+MODES = ('plan', 'stream')
+
+def trip_addresses(n_addresses, seed=0):
+    return [f'{i} synthetic st, stop {seed}-{i}' for i in range(n_addresses)]
+
+def plan_trip(start, end, search_distance, csv_path, began):
+    # (route_points, ddds_in_range, seconds to the first batch or None)
+    route_points, ddds_in_range = planner.plan_trip(start, end, search_distance, csv_path)
+    return route_points, ddds_in_range, None
+
+def stream_trip(start, end, search_distance, csv_path, began):
+    # new_app's search: stream the distance field out to MAX_SEARCH_DISTANCE and cut it
+    # at search_distance
+    all_ddd_locations, ddd_index = location_store.load_ddds(csv_path)
+    route_points = google_apis.get_route_points(start, end)
+    if len(route_points) == 0:
+        return route_points, planner.RouteMatches(all_ddd_locations, [], [], []), None
+    batches, first_batch = [], None
+    for batch in planner.stream_ddds_along_route(
+            all_ddd_locations, route_points, planner.MAX_SEARCH_DISTANCE, ddd_index, simplified=False):
+        if first_batch is None:
+            first_batch = time.perf_counter() - began
+        batches.append(batch)
+    return route_points, planner.within_distance(planner.join_matches(batches), search_distance), first_batch
+
+TRIPS = {'plan': plan_trip, 'stream': stream_trip}
+
+def run_session(session_id, n_trips, addresses, search_distance, think_time, csv_path, results, lock, mode='plan'):
+    # one user planning n_trips trips back to back, pausing think_time seconds between them
+    rng = random.Random(session_id)
+    trip = TRIPS[mode]
+    for _ in range(n_trips):
+        start, end = rng.sample(addresses, 2)
+        began = time.perf_counter()
+        first_batch = None
+        try:
+            route_points, ddds_in_range, first_batch = trip(start, end, search_distance, csv_path, began)
+            outcome = 'ok' if len(route_points) > 0 else 'no_route'
+        except Exception:
+            outcome = 'error'
+        elapsed = time.perf_counter() - began
+        with lock:
+            results.append((outcome, elapsed, first_batch))
+        if think_time:
+            time.sleep(rng.uniform(0, 2 * think_time))
+
+def summarize(results, wall_seconds):
+    latencies = np.array([elapsed for _, elapsed, _ in results])
+    first_batches = np.array([first for _, _, first in results if first is not None])
+    outcomes = {}
+    for outcome, _, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    summary = {'trips': len(results), 'wall_seconds': wall_seconds, 'trips_per_second': len(results) / wall_seconds}
+    summary.update(outcomes)
+    if len(latencies):
+        for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+            summary[f'p{p}_ms'] = value * 1000
+        summary['max_ms'] = latencies.max() * 1000
+    if len(first_batches):
+        for p, value in zip(PERCENTILES, np.percentile(first_batches, PERCENTILES)):
+            summary[f'first_batch_p{p}_ms'] = value * 1000
+    return summary
+
+def load_test(base_url, sessions=20, trips_per_session=10, n_addresses=200, search_distance=20,
+              think_time=0.0, csv_path='ddd_locations.csv', use_route_cache=False, mode='plan'):
+    # point google_apis at base_url, run the sessions and return the summary dict.
+    # google_apis' client and route cache are put back afterwards
+    saved_client, saved_route_cache = google_apis.client, google_apis.route_cache
+    with tempfile.TemporaryDirectory(prefix='ddd_loadtest_') as cache_dir:
+        try:
+            google_apis.client = MapsClient(base_url=base_url, pool_size=sessions)
+            if not use_route_cache:
+                # a throwaway cache so every trip asks the server and the real cache isn't filled
+                google_apis.route_cache = TieredCache(LRUCache(maxsize=1), DiskCache(os.path.join(cache_dir, 'routes.sqlite')))
+            location_store.load_ddds(csv_path)
+
+            addresses = trip_addresses(n_addresses)
+            results, lock = [], threading.Lock()
+            began = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=sessions) as executor:
+                futures = [
+                    executor.submit(run_session, i, trips_per_session, addresses, search_distance, think_time, csv_path, results, lock, mode)
+                    for i in range(sessions)
+                ]
+                for future in futures:
+                    future.result()
+            return summarize(results, time.perf_counter() - began)
+        finally:
+            google_apis.client, google_apis.route_cache = saved_client, saved_route_cache
+
+def start_server(args):
+    # the stand-in in a child process on a free port; (process, base_url)
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_maps_server.py'),
+               '--port', '0', '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+               '--error-rate', str(args.error_rate), '--over-limit-rate', str(args.over_limit_rate), '--seed', '0']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('serving on'):
+        process.kill()
+        raise RuntimeError(f'stand-in server did not start: {line!r}')
+    return process, line.split()[-1]
+
+def stop_server(process):
+    # interrupt the stand-in and return the request stats it prints on the way out
+    process.send_signal(signal.SIGINT)
+    try:
+        output, _ = process.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        output, _ = process.communicate()
+    for line in output.splitlines():
+        if line.startswith('requests'):
+            return line.split(' ', 1)[1]
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test trip planning against the stand-in maps server.')
+    parser.add_argument('--base-url', default=None, help='an already running stand-in; by default one is started here')
+    parser.add_argument('--mode', choices=MODES, default='plan', help='plan_trip, or new_app\'s streamed search')
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--trips', type=int, default=10, help='trips per session')
+    parser.add_argument('--addresses', type=int, default=200, help='distinct addresses trips are drawn from')
+    parser.add_argument('--search-distance', type=float, default=20)
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds between a session\'s trips')
+    parser.add_argument('--route-cache', action='store_true', help='use the real route cache')
+    parser.add_argument('--csv', default='ddd_locations.csv')
+    parser.add_argument('--latency-ms', type=float, default=100.0)
+    parser.add_argument('--jitter-ms', type=float, default=50.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--over-limit-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, server_stats = None, None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_server(args)
+
+    try:
+        summary = load_test(base_url, args.sessions, args.trips, args.addresses, args.search_distance,
+                            args.think_time, args.csv, args.route_cache, args.mode)
+    finally:
+        if server is not None:
+            server_stats = stop_server(server)
+
+    for name, value in summary.items():
+        print(f'{name:>20}: {value:,.2f}' if isinstance(value, float) else f'{name:>20}: {value}')
+    if server_stats:
+        print(f"{'server requests':>20}: {server_stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+import clustering
+import spatial_index
+from fileutil import atomic_write
+
+NA_VALUES = ['ERROR', 'ERROR, ERROR, ERROR ERROR']
+
+_loaded = {}
+_clusters = {}
+_lock = threading.Lock()
+
+# text columns with few distinct values, stored as codes into a category list
+CATEGORICAL_COLUMNS = ('state', 'city')
+
+def store_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.npy'
+
+def categories_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.categories.json'
+
+def clean_ddds(csv_path):
+    return pd.read_csv(csv_path, na_values=NA_VALUES)\
+        .dropna()\
+        .reset_index(drop=True)
+
+def code_dtype(n_categories):
+    # the smallest code type that can number n_categories values
+    for dtype in ('u2', 'u4'):
+        if n_categories <= np.iinfo(dtype).max + 1:
+            return dtype
+    raise ValueError(f'too many categories to store as codes: {n_categories}')
+
+def to_records(ddds):
+    # one structured array: numeric columns keep their dtype, CATEGORICAL_COLUMNS
+    # become uint16 codes (uint32 past 65536 values) into a sorted list of their values and the other text
+    # columns become fixed-width unicode, so the whole table can be memory mapped.
+    # returns (records, {column: categories})
+    dtype = []
+    categories = {}
+    for column in ddds.columns:
+        values = ddds[column]
+        if column in CATEGORICAL_COLUMNS:
+            categories[column] = np.unique(values.astype(str).to_numpy())
+            dtype.append((column, code_dtype(len(categories[column]))))
+        elif values.dtype.kind in 'iufb':
+            dtype.append((column, values.dtype))
+        else:
+            width = max(1, int(values.astype(str).str.len().max() or 1))
+            dtype.append((column, f'U{width}'))
+
+    records = np.empty(len(ddds), dtype=dtype)
+    for column in ddds.columns:
+        if column in categories:
+            records[column] = np.searchsorted(categories[column], ddds[column].astype(str).to_numpy())
+        elif ddds[column].dtype.kind in 'iufb':
+            records[column] = ddds[column].to_numpy()
+        else:
+            records[column] = ddds[column].astype(str)
+    return records, {column: values.tolist() for column, values in categories.items()}
+
+def build_store(csv_path='ddd_locations.csv'):
+    # clean the csv once and write it next to it as a .npy structured array, then
+    # its category lists tagged with the size and mtime of that .npy. readers only
+    # pair records with the categories written for that exact file, so a rebuild
+    # in another process can't mix new codes with old lists or the other way round.
+    store_path = store_path_for(csv_path)
+    records, categories = to_records(clean_ddds(csv_path))
+    with atomic_write(store_path) as f:
+        np.save(f, records)
+        f.flush()
+        stat = os.fstat(f.fileno())  # renaming it into place keeps size and mtime
+    with atomic_write(categories_path_for(csv_path), mode='w') as f:
+        json.dump({'store': [stat.st_size, stat.st_mtime_ns], 'categories': categories}, f)
+    return store_path
+
+def store_is_stale(csv_path):
+    store_path = store_path_for(csv_path)
+    return not os.path.exists(store_path) or not os.path.exists(categories_path_for(csv_path)) or\
+        os.path.getmtime(store_path) < os.path.getmtime(csv_path)
+
+def _read_store(csv_path):
+    # (records, categories), or None when the categories on disk weren't written
+    # for the .npy that was just mapped
+    store_path = store_path_for(csv_path)
+    stat = os.stat(store_path)
+    records = np.load(store_path, mmap_mode='r')
+    after = os.stat(store_path)
+    if (stat.st_ino, stat.st_size, stat.st_mtime_ns) != (after.st_ino, after.st_size, after.st_mtime_ns):
+        return None  # replaced while it was being mapped
+    try:
+        with open(categories_path_for(csv_path)) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(stored, dict) or stored.get('store') != [stat.st_size, stat.st_mtime_ns]:
+        return None
+    return records, stored['categories']
+
+STORE_READ_ATTEMPTS = 5
+
+def load_records(csv_path='ddd_locations.csv'):
+    # (read-only memory mapped records, {column: categories})
+    if store_is_stale(csv_path):
+        build_store(csv_path)
+    for attempt in range(STORE_READ_ATTEMPTS):
+        loaded = _read_store(csv_path)
+        if loaded is not None:
+            return loaded
+        if attempt == STORE_READ_ATTEMPTS // 2:
+            # still mismatched after waiting: a build died between its two writes
+            build_store(csv_path)
+        else:
+            time.sleep(0.05)  # another process is between writing the records and their categories
+    raise RuntimeError(f'no consistent store for {csv_path}')
+
+class LocationTable:
+    # the cleaned dataset, read-only and shared by every session: the memory mapped
+    # records, the state/city category lists and contiguous coordinate arrays.
+    # queries work on row numbers; rows() turns just the rows a result shows into
+    # a DataFrame, so nothing per session holds a copy of the table. version
+    # identifies the csv the table was built from, for caching query results.
+    def __init__(self, records, categories, version=None):
+        self.records = records
+        self.version = version
+        self.columns = records.dtype.names
+        self.categories = {
+            column: pd.Index([sys.intern(value) for value in values], dtype=object)
+            for column, values in categories.items()
+        }
+        self.latitude = np.array(records['latitude'], dtype=np.float64)
+        self.longitude = np.array(records['longitude'], dtype=np.float64)
+        self.latitude.flags.writeable = False
+        self.longitude.flags.writeable = False
+
+    def __len__(self):
+        return len(self.records)
+
+    def rows(self, index=None):
+        # DataFrame of the given row numbers (every row when None), indexed by row number
+        index = np.arange(len(self)) if index is None else np.asarray(index, dtype=np.int64)
+        selected = self.records[index]
+        data = {}
+        for column in self.columns:
+            if column in self.categories:
+                data[column] = pd.Categorical.from_codes(selected[column].astype(np.int64), categories=self.categories[column])
+            else:
+                data[column] = selected[column]
+        return pd.DataFrame(data, index=index)
+
+def load_ddds(csv_path='ddd_locations.csv'):
+    # one shared (LocationTable, GridIndex) per csv for the whole process. imported
+    # modules outlive streamlit reruns and sessions, so this is loaded once per server.
+    # the csv is checked for changes on every call so a rebuilt dataset is picked up.
+    key = os.path.abspath(csv_path)
+    mtime = os.path.getmtime(csv_path)
+    with _lock:
+        cached = _loaded.get(key)
+        if cached is None or cached[0] != mtime:
+            version = (key, *spatial_index.source_signature(csv_path))
+            all_ddd_locations = LocationTable(*load_records(csv_path), version=version)
+            ddd_index = spatial_index.load_or_build_index(
+                all_ddd_locations.latitude, all_ddd_locations.longitude, csv_path)
+            cached = _loaded[key] = (mtime, all_ddd_locations, ddd_index)
+    return cached[1], cached[2]
+
+def load_clusters(csv_path='ddd_locations.csv'):
+    # the ClusterHierarchy for load_ddds' frame, shared the same way and rebuilt
+    # when the csv changes
+    all_ddd_locations, _ = load_ddds(csv_path)
+    key = os.path.abspath(csv_path)
+    with _lock:
+        cached = _clusters.get(key)
+        if cached is None or cached[0] is not all_ddd_locations:
+            hierarchy = clustering.ClusterHierarchy(all_ddd_locations.latitude, all_ddd_locations.longitude)
+            cached = _clusters[key] = (all_ddd_locations, hierarchy)
+    return cached[1]
+
+if __name__ == "__main__":
+    print(build_store())
@@ -0,0 +1,74 @@
+import folium
+import simplify
+import numpy as np
+
+def ddd_feature_collection(ddd_locations):
+    # minimal geojson for the marker layer: a point plus the popup fields per row
+    lats = ddd_locations['latitude'].round(5).tolist()
+    lons = ddd_locations['longitude'].round(5).tolist()
+    names = ddd_locations['loc_name'].tolist()
+    addresses = ddd_locations['full_address'].tolist()
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                'properties': {'loc_name': name, 'full_address': address},
+            }
+            for lat, lon, name, address in zip(lats, lons, names, addresses)
+        ],
+    }
+
+def ddd_marker_layer(ddd_locations, name='DDD locations'):
+    # every location as one GeoJson layer drawn with circle markers. popups are
+    # built in the browser when a marker is clicked, so the page holds one copy of
+    # the data instead of a CircleMarker and Popup per row.
+    return folium.GeoJson(
+        ddd_feature_collection(ddd_locations),
+        name=name,
+        marker=folium.CircleMarker(radius=5, color='red', fill=True),
+        popup=folium.GeoJsonPopup(fields=['loc_name', 'full_address'], labels=False, max_width=150),
+        embed=True,
+    )
+
+def cluster_layer(clusters, ddd_locations, name='DDD clusters'):
+    # one ClusterHierarchy.query result: multi-location clusters become a sized
+    # circle labelled with their count, single locations (rows of the
+    # LocationTable ddd_locations) the usual markers
+    group = folium.FeatureGroup(name=name)
+    multi = clusters['count'] > 1
+    for lat, lon, count in zip(clusters['latitude'][multi], clusters['longitude'][multi], clusters['count'][multi]):
+        folium.CircleMarker(
+            location=[float(lat), float(lon)],
+            radius=float(6 + 3 * np.log2(count)),
+            color='red',
+            fill=True,
+            fill_opacity=0.6,
+            tooltip=f'{count} locations',
+        ).add_to(group)
+
+    singles = clusters['member'][~multi]
+    if len(singles) > 0:
+        ddd_marker_layer(ddd_locations.rows(singles), name=name + ' (single)').add_to(group)
+    return group
+
+def route_map(route_points, ddd_locations, location=(38, -96), zoom_start=4):
+    # the route and its ddds on a folium map, ready to render or embed
+    m = folium.Map(location=list(location), zoom_start=zoom_start, zoom_control=False)
+
+    if len(route_points)>0:
+        # keep enough detail for a couple of zoom levels past the starting one
+        display_points = simplify.for_display(route_points, zoom=zoom_start + 2)
+        pl = folium.PolyLine(
+            [[lat,lon] for lat,lon in display_points],
+            color='blue',
+            weight=3,
+            opacity=0.5
+        )
+        pl.add_to(m)
+
+    if len(ddd_locations)>0:
+        ddd_marker_layer(ddd_locations).add_to(m)
+
+    return m
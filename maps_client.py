@@ -0,0 +1,68 @@
+import os
+import time
+import random
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = 'https://maps.googleapis.com'
+
+# api statuses worth asking again for; everything else is the final answer
+RETRY_STATUSES = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+class MapsClient:
+    # one pooled keep-alive session for all google maps web service calls. requests
+    # time out after `timeout` seconds (connect, read) and are retried up to
+    # max_retries times with jittered exponential backoff on connection errors,
+    # 5xx responses and RETRY_STATUSES. base_url (or GOOGLE_MAPS_BASE_URL) can point
+    # the client at a local stand-in server. without an api_key, GOOGLE_MAPS_API_KEY
+    # is read when a request is made, so importing never needs it.
+    def __init__(self, api_key=None, base_url=None, timeout=(3.05, 10), max_retries=3, backoff=0.5, pool_size=10):
+        self.api_key = api_key
+        self.base_url = (base_url or os.environ.get('GOOGLE_MAPS_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep_before_retry(self, attempt):
+        # "full jitter": anywhere between 0 and the exponential cap
+        time.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+    def get_json(self, path, params, timeout=None):
+        # GET base_url + path and return the decoded json. if every attempt hit a
+        # retryable api status the last response is returned for the caller to
+        # report; if every attempt failed at the http level the last error is raised.
+        params = dict(params)
+        api_key = self.api_key or os.environ.get('GOOGLE_MAPS_API_KEY')
+        if api_key:
+            params['key'] = api_key
+        elif self.base_url == DEFAULT_BASE_URL:
+            raise RuntimeError('GOOGLE_MAPS_API_KEY is not set')
+
+        data, error = None, None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self._sleep_before_retry(attempt - 1)
+            try:
+                response = self.session.get(self.base_url + path, params=params, timeout=timeout or self.timeout)
+                if response.status_code >= 500:
+                    response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                error = e
+                continue
+
+            response.raise_for_status()
+            data = response.json()
+            if data.get('status') not in RETRY_STATUSES:
+                return data
+
+        if data is not None:
+            return data
+        raise error
+
+    def close(self):
+        self.session.close()
@@ -1,161 +1,146 @@
-import math
-import random
+import os
+import uuid
 import folium
+import map_layers
 import google_apis
-import numpy as np
-import pandas as pd
+import location_store
+import planner
+import detour
+import instrumentation
 import streamlit as st
 from streamlit_folium import st_folium, folium_static
 
-def load_ddds():
-    all_ddd_locations = pd.read_csv('ddd_locations.csv', 
-        na_values=['ERROR', 'ERROR, ERROR, ERROR ERROR'])\
-        .dropna()\
-        .sample(frac=1)\
-        .reset_index(drop=True)
-    all_ddd_locations['route_order'] = float('nan')
-    all_ddd_locations['range'] = float('nan')
-    all_ddd_locations['range_status'] = float('nan')
-    return all_ddd_locations
-
-def calc_filter_window(route_points, search_distance):
-    # search_distance in kms
-    lats = [point[0] for point in route_points]
-    lons = [point[1] for point in route_points]
-    rt_min_lat = min(lats)
-    rt_max_lat = max(lats)
-    rt_min_lon = min(lons)
-    rt_max_lon = max(lons)
-
-    lon_offset= (search_distance * 360) / (2 * math.pi * 6371.0 * math.cos(math.radians(rt_max_lat)))
-    lat_offset = search_distance/111.0
-
-    lat_window = rt_min_lat - lat_offset, rt_max_lat + lat_offset
-    lon_window = rt_min_lon - lon_offset, rt_max_lon + lon_offset
-
-    ne_point = rt_max_lat + lat_offset, rt_max_lon + lon_offset
-    sw_point = rt_min_lat - lat_offset, rt_min_lon - lon_offset
-
-    return sw_point, ne_point
-
-def calculate_zoom_level(lat1, lon1, lat2, lon2, width_pixels):
-    R = 6371  # Earth's radius in kilometers
-    B = width_pixels  # Width of the map window in pixels
-
-    delta_lon = abs(lon1 - lon2)
-    lat_rad = math.radians(lat1)
-    zoom = math.log2(360 * ((2 * R * math.cos(lat_rad) * math.pi) / (256 * B * delta_lon)))
-
-    return int(zoom)
-
-def haversine_distance(pt1, pt2):
-    r = 6371.0  # Earth's radius in kilometers
-
-    lat1, lon1 = pt1
-    lat2, lon2 = pt2
-
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-
-    delta_lat = lat2_rad - lat1_rad
-    delta_lon = lon2_rad - lon1_rad
-
-    a = math.sin(delta_lat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    distance = r * c  # Distance in kilometers
-    return distance
-
-def range_calc(ddd_row, rdm_rt_pt):
-    ddd_lat = ddd_row['latitude']
-    ddd_lon = ddd_row['longitude']
-    return haversine_distance(rdm_rt_pt, (ddd_lat, ddd_lon))
-
-def package_route_points(route_points):
-    route_points_df = pd.DataFrame(route_points, columns=['latitude', 'longitude'])
-    route_df = route_points_df[['longitude', 'latitude']].apply(list, axis=1).to_frame()
-    route_df['num'] = 0
-    route_df = route_df.groupby('num').agg(**{
-        'path': pd.NamedAgg(column=0, aggfunc=list)
-    })
-    return route_df
-
-def find_ddds_along_route(ddds, route_points, filter_window, search_distance):
-    # ddds = all_ddd_locations#.drop(columns=['address', 'city', 'state', 'zip', 'url']).sample(20)################################
-    sw_point, ne_point = filter_window
-    coord_filter = (ddds['latitude'] > sw_point[0]) & (ddds['latitude'] < ne_point[0]) &\
-                   (ddds['longitude'] > sw_point[1]) & (ddds['longitude'] < ne_point[1])
-
-    ddds['range_status'] = np.where(coord_filter, 'calculating', 'out_of_range')
-    rdm_rt_pts = random.sample(list(enumerate(route_points)), len(route_points))
-    for idx, rdm_rt_pt in rdm_rt_pts:
-        calcing = ddds['range_status'] == 'calculating'
-        if ddds[calcing].shape[0] == 0:
-            break
-    
-        ddddist = ddds.loc[calcing, ['latitude', 'longitude']].apply(range_calc, rdm_rt_pt=rdm_rt_pt, axis=1)
-        ddds.loc[calcing, 'range_status'] = np.where(ddddist < search_distance, 'in_range', 'calculating')
-        ddds.loc[ddds['range_status'] == 'in_range', 'route_order'] = idx
-    ddds.loc[ddds['range_status'] == 'calculating', 'range_status'] = 'out_of_range'
-    ddds_in_range = ddds[ddds['range_status'] == 'in_range']
-    return ddds_in_range
-
 def render_map(route_points, ddd_locations):
-    m = folium.Map(location=[38,-96], zoom_start=4, zoom_control=False)
-
-    if len(route_points)>0:
-        pl = folium.PolyLine(
-            [[lat,lon] for lat,lon in route_points],
-            color='blue',
-            weight=3,
-            opacity=0.5
+    trace = instrumentation.current()
+    with trace.stage('map_build'):
+        m = map_layers.route_map(route_points, ddd_locations, location=[38,-96], zoom_start=4)
+    with trace.stage('map_render'):
+        folium_static(m, width=700, height=500)
+
+# partial maps drawn while a new route streams in, before the final one
+STREAM_REDRAWS = 3
+
+def render_route(map_slot, itinerary_slot, route_points, ddds_in_range):
+    # fills (or replaces) the route map and itinerary placeholders
+    with map_slot.container():
+        render_map(route_points, ddds_in_range)
+    if len(ddds_in_range) > 0:
+        with itinerary_slot.container():
+            st.header('Itinerary')
+            with instrumentation.current().stage('table_render'):
+                st.dataframe(planner.itinerary(ddds_in_range))
+
+def map_view(state, default_center=(38, -96), default_zoom=4):
+    # (bounds, zoom) last reported by the browse map, or the starting view
+    bounds = state.get('bounds') if state else None
+    if bounds and bounds['_southWest']['lat'] is not None:
+        sw, ne = bounds['_southWest'], bounds['_northEast']
+        return ((sw['lat'], sw['lng']), (ne['lat'], ne['lng'])), state.get('zoom', default_zoom)
+    # roughly the 700x500 starting map, so the first render doesn't draw everything
+    lat, lon = default_center
+    return ((lat - 20, lon - 45), (lat + 20, lon + 45)), default_zoom
+
+def render_cluster_map(ddd_locations, ddd_clusters, key='ddd_browse_map'):
+    # browse mode: the base map stays the same between reruns and only the
+    # clusters in the current viewport at the current zoom are sent as a feature
+    # group. st_folium stores each pan/zoom in session_state[key] before the rerun.
+    trace = instrumentation.current()
+    with trace.stage('map_build'):
+        zoom_start = 4
+        m = folium.Map(location=[38,-96], zoom_start=zoom_start, zoom_control=False)
+        bounds, zoom = map_view(st.session_state.get(key))
+        clusters = ddd_clusters.query(bounds, zoom)
+        cluster_group = map_layers.cluster_layer(clusters, ddd_locations)
+    trace.count('clusters', len(clusters['count']))
+    with trace.stage('map_render'):
+        st_folium(
+            m,
+            key=key,
+            width=700,
+            height=500,
+            feature_group_to_add=cluster_group,
+            returned_objects=['bounds', 'zoom'],
         )
-        pl.add_to(m)
-
-    for _, ddd_loc in ddd_locations.iterrows():
-        popup = folium.Popup(f"<b>{ddd_loc['loc_name']}</b><br>{ddd_loc['full_address']}", max_width=150)
-        marker = folium.CircleMarker(
-            [ddd_loc['latitude'], ddd_loc['longitude']],
-            radius=5,
-            color='red',
-            fill=True,
-            popup=popup
-        )
-        marker.add_to(m)
-
-    folium_static(m, width=700, height=500)
 
 
 st.set_page_config(layout="wide", page_title="DDD Finder")
 
+instrumentation.configure_logging()
+if os.environ.get('DDD_METRICS_PORT'):
+    instrumentation.serve_metrics(int(os.environ['DDD_METRICS_PORT']), os.environ.get('DDD_METRICS_HOST', '127.0.0.1'))
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex[:12])
+trace = instrumentation.start_trace('rerun', session_id)
+
 st.sidebar.header("Plan your trip")
 start_address = st.sidebar.text_input("From:")
 end_address = st.sidebar.text_input("To:")
-search_distance = st.sidebar.slider("Search Distance (miles):", min_value=0, max_value=120, value=20)
+search_distance = st.sidebar.slider("Search Distance (miles):", min_value=0, max_value=planner.MAX_SEARCH_DISTANCE, value=20)
+rank_detours = st.sidebar.checkbox("Rank stops by detour time")
+detour_stops = st.sidebar.slider("Stops to rank:", min_value=1, max_value=25, value=10, disabled=not rank_detours)
+show_timings = st.sidebar.checkbox("Show timings")
 
-all_ddd_locations = load_ddds()
-ddds_in_range = all_ddd_locations
+all_ddd_locations, ddd_index = location_store.load_ddds()
+ddds_in_range = None
 route_points = []
-
-if start_address and end_address:
-    print('got start and end points', flush=True)
-    route_points = google_apis.get_route_points(start_address, end_address)
-    print('got route', flush=True)
-    if len(route_points) > 0:
-        print('route long enough', flush=True)
-        filter_window = calc_filter_window(route_points, search_distance)
-        print('got filter window', flush=True)
-        ddds_in_range = find_ddds_along_route(all_ddd_locations, route_points, filter_window, search_distance)
-        print('got ddds', flush=True)
+shown = None  # how many matches streaming left on the map
 
 st.header('DDD Locations on Route')
-print('rendering map', flush=True)
-render_map(route_points, ddds_in_range)
-# st.table(ddds_in_range)
-
-
+map_slot = st.empty()
+itinerary_slot = st.empty()
 
+if start_address and end_address:
+    # the route and every location's distance to it are worked out once per route
+    # (and dataset); moving the slider only filters the saved distances
+    route_key = google_apis.normalize_address(start_address) + '|' + google_apis.normalize_address(end_address)
+    planned = st.session_state.get('planned_route')
+    if planned is None or planned['route_key'] != route_key or planned['ddds'] is not all_ddd_locations:
+        planned = None
+        route_points = google_apis.get_route_points(start_address, end_address)
+        if len(route_points) > 0:
+            # the first stops found go on the map straight away. every redraw sends
+            # the whole map again, so after that it is only redrawn when the number
+            # of stops has doubled, at most STREAM_REDRAWS times, and then once at the end
+            batches = []
+            n_found = redraws = 0
+            for batch in planner.stream_ddds_along_route(
+                    all_ddd_locations, route_points, planner.MAX_SEARCH_DISTANCE, ddd_index, simplified=False):
+                batches.append(batch)
+                n_found += len(batch.within(search_distance))
+                if redraws < STREAM_REDRAWS and n_found > 0 and n_found >= 2 * (shown or 0):
+                    found = planner.join_matches(batches).within(search_distance)
+                    render_route(map_slot, itinerary_slot, route_points, found.frame())
+                    shown = len(found)
+                    redraws += 1
+            planned = st.session_state['planned_route'] = {
+                'route_key': route_key,
+                'ddds': all_ddd_locations,
+                'route_points': route_points,
+                'ddds_near_route': planner.join_matches(batches),
+            }
+    if planned is not None:
+        route_points = planned['route_points']
+        ddds_in_range = planner.within_distance(planned['ddds_near_route'], search_distance)
+
+if len(route_points) > 0:
+    ddds_in_range = ddds_in_range.frame()
+    if shown != len(ddds_in_range):
+        render_route(map_slot, itinerary_slot, route_points, ddds_in_range)
+else:
+    with map_slot.container():
+        render_cluster_map(all_ddd_locations, location_store.load_clusters())
+# st.table(ddds_in_range)
 
+if rank_detours and len(route_points) > 0 and len(ddds_in_range) > 0:
+    ranked = detour.rank_by_detour(route_points, ddds_in_range, top_n=detour_stops)
+    ranked = ranked[ranked['detour_s'].notna()]
+    st.header('Quickest stops')
+    with trace.stage('table_render'):
+        st.dataframe(
+            ranked.assign(detour_min=(ranked['detour_s'] / 60).round(), range=ranked['range'].round(1))
+                [['loc_name', 'full_address', 'detour_min', 'range']],
+            hide_index=True,
+        )
 
+trace.finish()
+if show_timings:
+    instrumentation.render_sidebar(trace)
@@ -0,0 +1,119 @@
+import os
+import csv
+import sys
+import json
+import argparse
+import planner
+import location_store
+import instrumentation
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+RESULT_FIELDS = ['trip_id', 'start', 'end', 'search_distance', 'status', 'error', 'route_points', 'n_ddds', 'stages_ms', 'ddds']
+
+def read_trips(path, search_distance):
+    # origin/destination pairs from a csv (start,end[,search_distance] columns)
+    # or a jsonl file with the same keys, streamed one trip at a time
+    with open(path, newline='') as f:
+        if path.endswith('.jsonl'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for i, row in enumerate(rows):
+            yield {
+                'trip_id': row.get('trip_id') or str(i),
+                'start': row['start'],
+                'end': row['end'],
+                'search_distance': float(row.get('search_distance') or search_distance),
+            }
+
+def init_worker(csv_path):
+    # load the dataset and index once per worker instead of once per trip. the
+    # processes already use every core, so corridor searches stay single threaded
+    planner.CORRIDOR_WORKERS = 1
+    location_store.load_ddds(csv_path)
+
+def plan_one(trip, csv_path):
+    result = dict(trip, status='ok', error='', route_points=0, n_ddds=0, stages_ms={}, ddds=[])
+    trace = instrumentation.start_trace('trip', trip['trip_id'])
+    try:
+        route_points, ddds_in_range = planner.plan_trip(trip['start'], trip['end'], trip['search_distance'], csv_path)
+    except Exception as e:
+        trace.finish()
+        return dict(result, status='error', error=repr(e), stages_ms=trace.to_dict()['stages_ms'])
+    result['stages_ms'] = trace.finish().to_dict()['stages_ms']
+    if len(route_points) == 0:
+        return dict(result, status='no_route')
+
+    result['route_points'] = len(route_points)
+    result['n_ddds'] = len(ddds_in_range)
+    ddds_in_range = ddds_in_range.frame()
+    result['ddds'] = [
+        {'loc_name': name, 'full_address': address, 'range': round(float(dist), 3), 'route_km': round(float(km), 3),
+         'eta_fraction': round(float(eta), 4)}
+        for name, address, dist, km, eta in zip(
+            ddds_in_range['loc_name'], ddds_in_range['full_address'], ddds_in_range['range'],
+            ddds_in_range['route_km'], ddds_in_range['eta_fraction'])
+    ]
+    return result
+
+class ResultWriter:
+    # one row per trip, flushed as soon as it is written so the output can be
+    # tailed or consumed while the batch is still running
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, result):
+        if self.fmt == 'csv':
+            self.writer.writerow(dict(result, stages_ms=json.dumps(result['stages_ms']), ddds=json.dumps(result['ddds'])))
+        else:
+            self.f.write(json.dumps(result) + '\n')
+        self.f.flush()
+
+def plan_trips(trips, write, csv_path='ddd_locations.csv', workers=None, max_pending=None):
+    # fan trips out over a process pool and hand each result to write() in
+    # completion order. at most max_pending trips are in flight, so a large
+    # input file is never held in memory all at once.
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    done_count = 0
+    # build any missing store/index files here, before the workers all try to
+    location_store.load_ddds(csv_path)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(csv_path,)) as executor:
+        pending = set()
+        for trip in trips:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+                    done_count += 1
+            pending.add(executor.submit(plan_one, trip, csv_path))
+        for future in wait(pending).done:
+            write(future.result())
+            done_count += 1
+    return done_count
+
+def main():
+    parser = argparse.ArgumentParser(description='Find DDD locations along many trips.')
+    parser.add_argument('trips', help='csv or jsonl file with start and end columns')
+    parser.add_argument('--output', default='-', help='.jsonl or .csv file, or - for jsonl on stdout')
+    parser.add_argument('--search-distance', type=float, default=20, help='kms, for trips without their own')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per cpu)')
+    parser.add_argument('--csv', default='ddd_locations.csv', help='ddd dataset')
+    args = parser.parse_args()
+
+    fmt = 'csv' if args.output.endswith('.csv') else 'jsonl'
+    f = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        writer = ResultWriter(f, fmt)
+        n_trips = plan_trips(read_trips(args.trips, args.search_distance), writer.write, args.csv, args.workers)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    print('planned', n_trips, 'trips', file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import os
+import math
+import hashlib
+import threading
+import corridor
+import simplify
+import google_apis
+import location_store
+import instrumentation
+import numpy as np
+import pandas as pd
+from cache import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+
+# the trip planning used by the apps, without streamlit, so it can also run
+# from scripts and worker processes
+
+@instrumentation.timed('window_filter')
+def calc_filter_window(route_points, search_distance):
+    # search_distance in kms
+    lats = [point[0] for point in route_points]
+    lons = [point[1] for point in route_points]
+    rt_min_lat = min(lats)
+    rt_max_lat = max(lats)
+    rt_min_lon = min(lons)
+    rt_max_lon = max(lons)
+
+    lon_offset= (search_distance * 360) / (2 * math.pi * 6371.0 * math.cos(math.radians(rt_max_lat)))
+    lat_offset = search_distance/111.0
+
+    ne_point = rt_max_lat + lat_offset, rt_max_lon + lon_offset
+    sw_point = rt_min_lat - lat_offset, rt_min_lon - lon_offset
+
+    return sw_point, ne_point
+
+def calculate_zoom_level(lat1, lon1, lat2, lon2, width_pixels):
+    R = 6371  # Earth's radius in kilometers
+    B = width_pixels  # Width of the map window in pixels
+
+    delta_lon = abs(lon1 - lon2)
+    lat_rad = math.radians(lat1)
+    zoom = math.log2(360 * ((2 * R * math.cos(lat_rad) * math.pi) / (256 * B * delta_lon)))
+
+    return int(zoom)
+
+def package_route_points(route_points):
+    # one PathLayer row holding the whole route as [lon, lat] pairs
+    route_points = np.round(np.asarray(route_points, dtype=np.float64).reshape(-1, 2), 5)
+    return pd.DataFrame({'path': [route_points[:, ::-1].tolist()]})
+
+# largest search distance the apps offer, in kms
+MAX_SEARCH_DISTANCE = 120
+
+# corridor searches bigger than TILED_MIN_CELLS (route points x candidates) are
+# split along the route and run on a shared pool of CORRIDOR_WORKERS threads
+CORRIDOR_WORKERS = int(os.environ.get('DDD_CORRIDOR_WORKERS', os.cpu_count() or 1))
+TILED_MIN_CELLS = 2_000_000
+
+_corridor_pool = None
+_corridor_pool_lock = threading.Lock()
+
+def corridor_pool():
+    global _corridor_pool
+    with _corridor_pool_lock:
+        if _corridor_pool is None:
+            _corridor_pool = ThreadPoolExecutor(max_workers=CORRIDOR_WORKERS, thread_name_prefix='corridor')
+    return _corridor_pool
+
+def search_corridor(route_points, locations, max_distance):
+    # corridor.corridor_search, tiled over the thread pool when it is big enough to pay off
+    if CORRIDOR_WORKERS > 1 and len(route_points) * len(locations) > TILED_MIN_CELLS:
+        instrumentation.current().count('corridor_tiles', CORRIDOR_WORKERS)
+        return corridor.tiled_corridor_search(
+            route_points, locations, max_distance, n_tiles=CORRIDOR_WORKERS, executor=corridor_pool())
+    return corridor.corridor_search(route_points, locations, max_distance)
+
+class RouteMatches:
+    # a query result: row numbers into the shared LocationTable with each row's
+    # distance to the route (range) and position along the full route (route_km),
+    # in route order. three small arrays, cheap to keep per session; frame() builds
+    # the DataFrame for display from just these rows. total_km is the route's length.
+    def __init__(self, table, rows, range, route_km, total_km=0.0):
+        order = np.argsort(route_km, kind='stable')
+        self.table = table
+        self.total_km = float(total_km)
+        self.rows = np.asarray(rows, dtype=np.int64)[order]
+        self.range = np.asarray(range, dtype=np.float64)[order]
+        self.route_km = np.asarray(route_km, dtype=np.float64)[order]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def within(self, search_distance):
+        keep = self.range < search_distance
+        return RouteMatches(self.table, self.rows[keep], self.range[keep], self.route_km[keep], self.total_km)
+
+    def frame(self):
+        return self.table.rows(self.rows).assign(
+            range=self.range,
+            route_km=self.route_km,
+            eta_fraction=np.clip(self.route_km / self.total_km, 0.0, 1.0) if self.total_km > 0 else 0.0,
+            range_status='in_range',
+            route_order=np.arange(len(self)),
+        )
+
+def itinerary(ddds_in_range):
+    # the stops of a RouteMatches.frame() in the order the trip reaches them
+    return pd.DataFrame({
+        'stop': ddds_in_range['route_order'].to_numpy() + 1,
+        'loc_name': ddds_in_range['loc_name'].to_numpy(),
+        'full_address': ddds_in_range['full_address'].to_numpy(),
+        'route_km': ddds_in_range['route_km'].round(1).to_numpy(),
+        'range': ddds_in_range['range'].round(1).to_numpy(),
+        'eta_fraction': ddds_in_range['eta_fraction'].round(3).to_numpy(),
+    }).set_index('stop')
+
+def _ddds_near_route(ddds, route_points, filter_window, max_distance, ddd_index=None):
+    # RouteMatches for the ddds (a LocationTable) within max_distance kms of route_points,
+    # with route kms along route_points
+    if ddd_index is not None:
+        candidates = ddd_index.query_corridor(route_points, max_distance)
+    else:
+        sw_point, ne_point = filter_window
+        coord_filter = (ddds.latitude > sw_point[0]) & (ddds.latitude < ne_point[0]) &\
+                       (ddds.longitude > sw_point[1]) & (ddds.longitude < ne_point[1])
+        candidates = np.flatnonzero(coord_filter)
+
+    locations = np.c_[ddds.latitude[candidates], ddds.longitude[candidates]]
+    ddddist, route_km = search_corridor(route_points, locations, max_distance)
+    close = ddddist < max_distance
+
+    trace = instrumentation.current()
+    trace.count('route_points', len(route_points))
+    trace.count('candidates', len(candidates))
+    return RouteMatches(ddds, candidates[close], ddddist[close], route_km[close])
+
+# corridor results shared by every session in the process, keyed on the route
+# geometry, the search distance and the dataset version. a rebuilt csv gets a
+# new LocationTable.version, so its old results are never matched again and
+# age out of the lru.
+RESULT_CACHE_SIZE = int(os.environ.get('DDD_RESULT_CACHE_SIZE', 512))  # routes
+result_cache = LRUCache(maxsize=RESULT_CACHE_SIZE)
+instrumentation.metrics.register_cache('route_result', result_cache)
+
+def route_key(route_points):
+    route_points = np.ascontiguousarray(route_points, dtype=np.float64).reshape(-1, 2)
+    return hashlib.blake2b(route_points.tobytes(), digest_size=16).hexdigest()
+
+def _cached_result(kind, ddds, route_points, distance):
+    # (key, RouteMatches or None); the key is None for tables without a version
+    if ddds.version is None:
+        return None, None
+    key = (kind, route_key(route_points), float(distance), ddds.version)
+    cached = result_cache.get(key)
+    instrumentation.current().cache_lookup('route_result', cached is not None)
+    return key, None if cached is None else RouteMatches(ddds, *cached)
+
+def _remember(key, matches):
+    # only the row numbers and distances are kept, not the table
+    if key is None:
+        return
+    arrays = matches.rows, matches.range, matches.route_km
+    for array in arrays:
+        array.flags.writeable = False
+    result_cache.set(key, (*arrays, matches.total_km))
+
+def _cached_matches(kind, ddds, route_points, distance, search):
+    # search() on a miss
+    key, matches = _cached_result(kind, ddds, route_points, distance)
+    if matches is None:
+        matches = search()
+        _remember(key, matches)
+    return matches
+
+def within_distance(ddds_near_route, search_distance):
+    # the RouteMatches of a route's ddds (from route_distance_field) within search_distance
+    ddds_in_range = ddds_near_route.within(search_distance)
+    instrumentation.current().count('in_range', len(ddds_in_range))
+    return ddds_in_range
+
+@instrumentation.timed('corridor_search')
+def find_ddds_along_route(ddds, route_points, filter_window, search_distance, ddd_index=None):
+    # filter_window only narrows the search, so it isn't part of the cache key
+    def search():
+        geometry = corridor.RouteGeometry(route_points)
+        kept = simplify.corridor_vertices(geometry.points, search_distance)
+        matches = _ddds_near_route(ddds, geometry.points[kept], filter_window, search_distance, ddd_index)
+        # the search measured kms along the simplified route; move them onto the full one
+        return RouteMatches(ddds, matches.rows, matches.range,
+                            geometry.from_vertices(kept, matches.route_km), geometry.total_km)
+    return within_distance(_cached_matches('corridor', ddds, route_points, search_distance, search), search_distance)
+
+@instrumentation.timed('distance_field')
+def route_distance_field(ddds, route_points, max_distance=MAX_SEARCH_DISTANCE, ddd_index=None):
+    # every ddd within max_distance kms of the route, measured against the full
+    # route geometry. a location's distance to a route never changes, so any
+    # smaller search distance is then an exact within_distance() cut of these
+    # matches instead of a new corridor search.
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    def search():
+        geometry = corridor.RouteGeometry(route_points)
+        filter_window = calc_filter_window(route_points, max_distance)
+        matches = _ddds_near_route(ddds, route_points, filter_window, max_distance, ddd_index)
+        return RouteMatches(ddds, matches.rows, matches.range, matches.route_km, geometry.total_km)
+    return _cached_matches('distance_field', ddds, route_points, max_distance, search)
+
+# the streamed search works through the route in stretches of about this many kms
+STREAM_STRETCH_KM = 250.0
+
+def join_matches(batches):
+    # one RouteMatches from the batches of stream_ddds_along_route
+    return RouteMatches(
+        batches[0].table,
+        np.concatenate([batch.rows for batch in batches]),
+        np.concatenate([batch.range for batch in batches]),
+        np.concatenate([batch.route_km for batch in batches]),
+        batches[0].total_km,
+    )
+
+def stream_ddds_along_route(ddds, route_points, max_distance, ddd_index=None, simplified=True,
+                            stretch_km=STREAM_STRETCH_KM):
+    # the matches of find_ddds_along_route (simplified) or route_distance_field
+    # (not simplified) for max_distance, as RouteMatches batches in route order,
+    # so a long route can be shown as it is searched. the route is searched a
+    # stretch at a time; a candidate is settled once the search has passed the
+    # last stretch whose box (grown by max_distance) holds it, since no later
+    # stretch can come closer. stretches run on corridor_pool() when there is more
+    # than one worker. settled matches are yielded when nothing still
+    # unsettled could land before them on the route. the last batch is always
+    # yielded, even when empty, and join_matches() of all of them is the result
+    # the non-streamed function returns (and caches).
+    trace = instrumentation.current()
+    geometry = corridor.RouteGeometry(route_points)
+    key, cached = _cached_result('corridor' if simplified else 'distance_field', ddds, geometry.points, max_distance)
+    if cached is not None:
+        yield cached
+        return
+    if len(geometry.points) == 0:
+        yield RouteMatches(ddds, [], [], [])
+        return
+
+    if simplified:
+        kept = simplify.corridor_vertices(geometry.points, max_distance)
+    else:
+        kept = np.arange(len(geometry.points))
+    points = geometry.points[kept]
+    if ddd_index is not None:
+        candidates = ddd_index.query_corridor(points, max_distance)
+    else:
+        sw_point, ne_point = calc_filter_window(points, max_distance)
+        candidates = np.flatnonzero((ddds.latitude > sw_point[0]) & (ddds.latitude < ne_point[0]) &
+                                    (ddds.longitude > sw_point[1]) & (ddds.longitude < ne_point[1]))
+    locations = np.c_[ddds.latitude[candidates], ddds.longitude[candidates]]
+    trace.count('route_points', len(points))
+    trace.count('candidates', len(candidates))
+
+    seg_km = corridor.segment_lengths(points)
+    cum_km = np.concatenate([[0.0], np.cumsum(seg_km)])
+    bounds = np.unique(np.append(np.searchsorted(cum_km, np.arange(0.0, cum_km[-1], stretch_km)), len(points) - 1))
+    stretches = list(zip(bounds[:-1], bounds[1:])) or [(0, 0)]
+    pad = corridor.box_pad(max_distance, seg_km) if len(seg_km) else max_distance
+
+    near, last = [], np.full(len(candidates), -1)
+    for k, (start, stop) in enumerate(stretches):
+        near.append(np.flatnonzero(corridor.near_box(points[start:stop + 1], locations, pad)))
+        last[near[-1]] = k
+
+    def measure(k):
+        start, stop = stretches[k]
+        return corridor.corridor_search(points[start:stop + 1], locations[near[k]], max_distance)
+
+    # the stretches are tiles of the route: with more than one worker they all go
+    # to the shared pool at once and are taken back in route order
+    futures = []
+    if CORRIDOR_WORKERS > 1 and len(stretches) > 1:
+        futures = [corridor_pool().submit(measure, k) for k in range(len(stretches))]
+        results = (future.result() for future in futures)
+    else:
+        results = (measure(k) for k in range(len(stretches)))
+
+    min_dists = np.full(len(candidates), np.inf)
+    route_km = np.full(len(candidates), np.nan)
+    sent = np.zeros(len(candidates), dtype=bool)
+    batches = []
+    try:
+        for k, (start, stop) in enumerate(stretches):
+            cand = near[k]
+            with trace.stage('corridor_search'):
+                dists, kms = next(results)
+            # only a strictly closer stretch wins, as in corridor_search
+            closer = dists < min_dists[cand]
+            min_dists[cand[closer]] = dists[closer]
+            route_km[cand[closer]] = kms[closer] + cum_km[start]
+
+            settled = last <= k
+            # an unsettled candidate ends up where it is now or somewhere past this stretch
+            frontier = np.inf
+            if k < len(stretches) - 1:
+                pending = ~settled & np.isfinite(min_dists)
+                frontier = min(cum_km[stop], route_km[pending].min()) if pending.any() else cum_km[stop]
+            ready = np.flatnonzero(settled & ~sent & (min_dists < max_distance) & (route_km <= frontier))
+            sent[ready] = True
+            if len(ready) or k == len(stretches) - 1:
+                batch = RouteMatches(ddds, candidates[ready], min_dists[ready],
+                                     geometry.from_vertices(kept, route_km[ready]), geometry.total_km)
+                batches.append(batch)
+                trace.count('corridor_batches', 1)
+                yield batch
+    finally:
+        # a stream dropped part way (a streamlit rerun) leaves nothing queued
+        for future in futures:
+            future.cancel()
+    _remember(key, join_matches(batches))
+
+def plan_trip(start_address, end_address, search_distance, csv_path='ddd_locations.csv'):
+    # route between two addresses and the ddds within search_distance kms of it;
+    # (route_points, RouteMatches), both empty when there is no route
+    all_ddd_locations, ddd_index = location_store.load_ddds(csv_path)
+    route_points = google_apis.get_route_points(start_address, end_address)
+    if len(route_points) == 0:
+        return route_points, RouteMatches(all_ddd_locations, [], [], [])
+
+    filter_window = calc_filter_window(route_points, search_distance)
+    ddds_in_range = find_ddds_along_route(all_ddd_locations, route_points, filter_window, search_distance, ddd_index)
+    return route_points, ddds_in_range
@@ -0,0 +1,84 @@
+import numpy as np
+
+# google's encoded polyline format: each coordinate delta is scaled by 1e5,
+# zigzag encoded and written as 5-bit chunks, low chunk first, offset by 63,
+# with 0x20 set on every chunk except the last one of a value.
+PRECISION = 1e5
+
+def _decode_values(data):
+    # every signed integer in a buffer of (byte - 63) chunks
+    chunks = data.astype(np.int64)
+    if len(chunks) == 0:
+        return np.empty(0, dtype=np.int64)
+    last = chunks < 0x20
+    if not last[-1]:
+        raise ValueError('polyline ends in the middle of a value')
+
+    ends = np.flatnonzero(last)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    value_ids = np.concatenate([[0], np.cumsum(last[:-1])]).astype(np.int64)
+    shifts = 5 * (np.arange(len(chunks)) - starts[value_ids])
+
+    values = np.add.reduceat((chunks & 0x1f) << shifts, starts)
+    return np.where(values & 1, ~(values >> 1), values >> 1)
+
+def _to_buffer(polyline_str):
+    return np.frombuffer(polyline_str.encode('ascii'), dtype=np.uint8) - np.uint8(63)
+
+def decode(polyline_str):
+    # encoded polyline -> contiguous float64 array of shape (n, 2), (lat, lon) rows
+    values = _decode_values(_to_buffer(polyline_str))
+    if len(values) % 2:
+        raise ValueError('polyline has an unpaired coordinate')
+    return values.reshape(-1, 2).cumsum(axis=0) / PRECISION
+
+def decode_many(polyline_strs):
+    # decode a batch of polylines (e.g. every step of a route) in one pass; returns
+    # one (n_i, 2) array per input
+    polyline_strs = list(polyline_strs)
+    if not polyline_strs:
+        return []
+
+    for polyline_str in polyline_strs:
+        if polyline_str and ord(polyline_str[-1]) - 63 >= 0x20:
+            raise ValueError('polyline ends in the middle of a value')
+
+    data = _to_buffer(''.join(polyline_strs))
+    values = _decode_values(data)
+    # values per polyline = terminating chunks inside each polyline's byte range
+    bounds = np.cumsum([len(polyline_str) for polyline_str in polyline_strs])
+    value_bounds = np.searchsorted(np.flatnonzero(data < 0x20), bounds, side='left')
+    counts = np.diff(np.concatenate([[0], value_bounds]))
+    if np.any(counts % 2):
+        raise ValueError('polyline has an unpaired coordinate')
+
+    deltas = values.reshape(-1, 2)
+    totals = deltas.cumsum(axis=0)
+    point_bounds = np.concatenate([[0], value_bounds // 2])
+    # each polyline's deltas restart from zero, so subtract the running total
+    # accumulated by the polylines before it
+    offsets = np.vstack([np.zeros((1, 2), dtype=np.int64), totals])[point_bounds[:-1]]
+    coords = (totals - np.repeat(offsets, np.diff(point_bounds), axis=0)) / PRECISION
+    return np.split(coords, point_bounds[1:-1])
+
+def encode(points):
+    # (n, 2) lat/lon array -> encoded polyline string
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return ''
+
+    scaled = np.round(points * PRECISION).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = (deltas << 1) ^ (deltas >> 63)
+
+    n_chunks = np.ones(len(values), dtype=np.int64)
+    remaining = values >> 5
+    while np.any(remaining):
+        n_chunks += remaining > 0
+        remaining >>= 5
+
+    k = np.arange(n_chunks.max())
+    chunks = (values[:, None] >> (5 * k)) & 0x1f
+    chunks |= np.where(k < (n_chunks - 1)[:, None], 0x20, 0)
+    chunks = chunks[k < n_chunks[:, None]] + 63
+    return chunks.astype(np.uint8).tobytes().decode('ascii')
@@ -0,0 +1,18 @@
+import numpy as np
+import spatial_index
+
+# synthetic routes between real endpoints, one point every ~step km with a
+# little wander so they look like a decoded overview polyline. shared by the
+# benchmarks and the stand-in maps server
+ROUTES = {
+    'city_hop': [(34.0522, -118.2437), (34.0195, -118.4912)],  # downtown LA -> santa monica
+    'regional': [(34.0522, -118.2437), (34.9, -117.0), (36.1699, -115.1398)],  # LA -> las vegas
+    'coast_to_coast': [(34.0522, -118.2437), (35.1, -106.6), (39.1, -94.6), (41.9, -87.6), (40.7128, -74.0060)],
+}
+
+def synthetic_route(waypoints, step=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    route = spatial_index.densify(np.asarray(waypoints, dtype=np.float64), step)
+    wander = rng.normal(0.0, step / 400, size=route.shape).cumsum(axis=0)
+    wander -= np.linspace(0, 1, len(route))[:, None] * wander[-1]  # keep the real endpoints
+    return route + wander
@@ -1,9 +1,33 @@
 print('moo', flush=True)
+import os
 import re
+import json
+import time
+import hashlib
+import argparse
+import threading
 import requests
 import google_apis
 import pandas as pd
+from cache import DiskCache
+from fileutil import atomic_write
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+class RateLimiter:
+    # lets at most one caller through every min_interval seconds, across threads
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.min_interval
+        time.sleep(start - now)
 
 def parse_address(loc_address):
     address_chunks = re.sub('<.*?>', '~', str(loc_address)).split('~')
@@ -69,40 +93,234 @@ def get_location_elements(soup):
     return location_elements
 
 
-with open('ddd_urls.txt') as uf:
-    lines = uf.readlines()
-    state_urls = [line.strip('\n') for line in lines]
+def read_state_urls(path='ddd_urls.txt'):
+    with open(path) as uf:
+        lines = uf.readlines()
+        return [line.strip('\n') for line in lines]
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-locations = []
+def fetch_state_page(url, session=requests, throttle=None, validators=None):
+    # validators are the etag / last_modified saved from an earlier fetch; when the
+    # page hasn't changed since, the server can answer 304 without a body
+    headers = {}
+    if validators and validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators and validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
 
-for url in state_urls:
-    print(f"Scraping {url}... ", end='', flush=True)
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    if throttle is not None:
+        throttle.wait()
+    return session.get(url, timeout=30, headers=headers)
+
+def parse_state_page(content):
+    soup = BeautifulSoup(content, 'html.parser')
 
     location_elements = get_location_elements(soup)
-    
-    new_locations = [
+
+    return [
         extract_location_data(location_element)
         for location_element
         in location_elements
     ]
-    
-    locations.extend(new_locations)
-    print("Success!")
 
-ddd_locs = pd.DataFrame(locations)
+def scrape_state(url, session=requests, throttle=None):
+    response = fetch_state_page(url, session, throttle)
+    return parse_state_page(response.content)
+
+def map_state_urls(func, state_urls, workers=1):
+    # func(url) for every url, run on a thread pool when workers > 1; results come
+    # back in state_urls order whatever order the pages finish in
+    if workers <= 1:
+        results = []
+        for url in state_urls:
+            print(f"Scraping {url}... ", end='', flush=True)
+            results.append(func(url))
+            print("Success!")
+        return results
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(func, url): url for url in state_urls}
+        for future in as_completed(futures):
+            future.result()
+            print(f"Scraped {futures[future]}", flush=True)
+        results = {url: future.result() for future, url in futures.items()}
+    return [results[url] for url in state_urls]
+
+def scrape_locations(state_urls, workers=1, min_interval=0.0):
+    # with workers > 1, pages are downloaded and parsed on a thread pool, starting
+    # at most one request every min_interval seconds. results are merged in
+    # state_urls order, so the output matches the serial scrape.
+    throttle = RateLimiter(min_interval) if min_interval > 0 else None
+    session = make_session(workers) if workers > 1 else requests
+
+    locations = []
+    for state_locations in map_state_urls(lambda url: scrape_state(url, session, throttle), state_urls, workers):
+        locations.extend(state_locations)
+    return locations
+
+def is_parseable(address):
+    # rows the scraper couldn't parse end up as 'ERROR, ERROR, ERROR ERROR'
+    return isinstance(address, str) and re.search(r'\bERROR\b', address) is None
+
+def geocode_addresses(addresses, cache_path='geocode_cache.sqlite', workers=4, min_interval=0.02):
+    # {full_address: (lat, lon)} for every parseable address. addresses are deduped
+    # on their normalized form, cached points are reused, and the rest are looked
+    # up on a thread pool that starts at most one request every min_interval
+    # seconds. successful lookups are added to the cache for the next refresh.
+    geocode_cache = DiskCache(cache_path)
+    by_key = {}
+    for address in addresses:
+        if is_parseable(address):
+            by_key.setdefault(google_apis.normalize_address(address), address)
+
+    points = geocode_cache.get_many(by_key)
+    todo = [key for key in by_key if key not in points]
+    print(f'geocoding {len(todo)} of {len(by_key)} addresses ({len(points)} cached)', flush=True)
+
+    throttle = RateLimiter(min_interval)
+
+    def lookup(key):
+        throttle.wait()
+        return key, google_apis.get_lat_lon(by_key[key])
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for key, point in executor.map(lookup, todo):
+            print(by_key[key], flush=True)
+            points[key] = point
+            if point != (None, None):
+                geocode_cache.set(key, point)
+
+    return {
+        address: points[google_apis.normalize_address(address)]
+        for address in addresses
+        if is_parseable(address)
+    }
+
+def locations_frame(locations):
+    ddd_locs = pd.DataFrame(locations, columns=['name', 'address', 'city', 'state', 'zip', 'url'])\
+        .rename(columns={'name': 'loc_name'})
+    ddd_locs['full_address'] = ddd_locs['address'] + ', ' + ddd_locs['city'] + ', ' + ddd_locs['state'] + ' ' + ddd_locs['zip']
+    return ddd_locs
+
+def location_keys(ddd_locs):
+    # a row is the same location across refreshes if it has the same page url, or
+    # for rows whose url couldn't be parsed, the same name and address
+    fallback = ddd_locs['loc_name'].astype(str) + '|' + ddd_locs['full_address'].astype(str)
+    return ddd_locs['url'].astype(str).where(ddd_locs['url'].astype(str) != 'ERROR', fallback)
+
+def write_csv_atomic(ddd_locs, csv_path):
+    with atomic_write(csv_path, 'w') as f:
+        ddd_locs.to_csv(f, index=False)
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def refresh_state(url, session, throttle, previous, known_keys):
+    # (manifest entry, parsed locations) for one state page; locations is None when
+    # the page is unchanged since the last refresh and its rows can be carried over
+    previous = previous or {}
+    carry_over = bool(previous.get('keys')) and set(previous['keys']) <= known_keys
+
+    response = fetch_state_page(url, session, throttle, previous if carry_over else None)
+    if response.status_code == 304:
+        return previous, None
+
+    digest = hashlib.sha256(response.content).hexdigest()
+    entry = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': digest,
+    }
+    if carry_over and previous.get('sha256') == digest:
+        return dict(entry, keys=previous['keys']), None
+
+    locations = parse_state_page(response.content)
+    entry['keys'] = location_keys(locations_frame(locations)).tolist()
+    return entry, locations
+
+def refresh_dataset(csv_path='ddd_locations.csv', manifest_path='ddd_scrape_manifest.json', state_urls=None,
+                    workers=1, min_interval=0.0, geocode_workers=4, geocode_interval=0.02):
+    # incremental refresh: unchanged state pages (304 or same content hash) reuse
+    # their rows from the existing csv, and only rows that are new or whose address
+    # changed get geocoded. the csv and manifest are replaced atomically.
+    state_urls = state_urls or read_state_urls()
+    if os.path.exists(csv_path):
+        existing = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+        existing['latitude'] = pd.to_numeric(existing['latitude'], errors='coerce')
+        existing['longitude'] = pd.to_numeric(existing['longitude'], errors='coerce')
+    else:
+        existing = locations_frame([]).assign(latitude=float('nan'), longitude=float('nan'))
+    existing['key'] = location_keys(existing)
+    manifest = load_manifest(manifest_path)
+
+    throttle = RateLimiter(min_interval) if min_interval > 0 else None
+    session = make_session(max(workers, 1))
+    known_keys = set(existing['key'])
+    results = map_state_urls(
+        lambda url: refresh_state(url, session, throttle, manifest.get(url), known_keys), state_urls, workers)
+
+    pages = []
+    new_manifest = {}
+    for url, (entry, locations) in zip(state_urls, results):
+        new_manifest[url] = entry
+        if locations is None:
+            page = existing.drop_duplicates('key').set_index('key').loc[entry['keys']].reset_index()
+        else:
+            page = locations_frame(locations)
+            page['key'] = location_keys(page)
+        pages.append(page[['key', 'loc_name', 'address', 'city', 'state', 'zip', 'url', 'full_address']])
+    changed = sum(locations is not None for _, locations in results)
+    print(f'{changed} of {len(state_urls)} state pages changed', flush=True)
+
+    # coordinates carry over for rows whose key and address are unchanged
+    known_points = existing[['key', 'full_address', 'latitude', 'longitude']]\
+        .drop_duplicates(['key', 'full_address'])
+    ddd_locs = pd.concat(pages, ignore_index=True).merge(known_points, on=['key', 'full_address'], how='left')
+    needs_geocode = ddd_locs['latitude'].isna()
+    points = geocode_addresses(ddd_locs.loc[needs_geocode, 'full_address'],
+                               workers=geocode_workers, min_interval=geocode_interval)
+    for address, (lat, lon) in points.items():
+        geocoded = needs_geocode & (ddd_locs['full_address'] == address)
+        ddd_locs.loc[geocoded, 'latitude'] = lat
+        ddd_locs.loc[geocoded, 'longitude'] = lon
+
+    write_csv_atomic(ddd_locs.drop(columns='key'), csv_path)
+    with atomic_write(manifest_path, 'w') as f:
+        json.dump(new_manifest, f, indent=1)
+    return ddd_locs.drop(columns='key')
 
-print('making full_addresses')
-ddd_locs['full_address'] = ddd_locs['address'] + ', ' + ddd_locs['city'] + ', ' + ddd_locs['state'] + ' ' + ddd_locs['zip']
+def main():
+    parser = argparse.ArgumentParser(description='Scrape DDD locations into ddd_locations.csv')
+    parser.add_argument('--workers', type=int, default=1, help='state pages fetched at once (1 = serial)')
+    parser.add_argument('--min-interval', type=float, default=0.25, help='minimum seconds between page requests')
+    parser.add_argument('--geocode-workers', type=int, default=4, help='geocoding requests in flight at once')
+    parser.add_argument('--geocode-interval', type=float, default=0.02, help='minimum seconds between geocoding requests')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only re-parse changed state pages and only geocode new or changed rows')
+    args = parser.parse_args()
 
-def resolve_addresses(row):
-    address = row['full_address']
-    print(address, flush=True)
-    lat, lon = google_apis.get_lat_lon(address)
-    return lat, lon
+    if args.incremental:
+        refresh_dataset(workers=args.workers, min_interval=args.min_interval,
+                        geocode_workers=args.geocode_workers, geocode_interval=args.geocode_interval)
+        return
 
-ddd_locs[['latitude', 'longitude']] = ddd_locs[['full_address']].apply(resolve_addresses, axis=1, result_type='expand')
-ddd_locs.to_csv('ddd_locations.csv', index=False)
+    locations = scrape_locations(read_state_urls(), workers=args.workers, min_interval=args.min_interval)
+    print('making full_addresses')
+    ddd_locs = locations_frame(locations)
 
+    points = geocode_addresses(ddd_locs['full_address'], workers=args.geocode_workers, min_interval=args.geocode_interval)
+    ddd_locs['latitude'] = ddd_locs['full_address'].map(lambda address: points.get(address, (None, None))[0])
+    ddd_locs['longitude'] = ddd_locs['full_address'].map(lambda address: points.get(address, (None, None))[1])
+    write_csv_atomic(ddd_locs, 'ddd_locations.csv')
 
+if __name__ == "__main__":
+    main()
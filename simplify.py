@@ -0,0 +1,71 @@
+import math
+import numpy as np
+import corridor
+
+# fraction of the search distance the corridor geometry may deviate from the route
+CORRIDOR_ERROR_RATIO = 0.05
+
+def _to_km_xyz(route_points):
+    return corridor.to_unit_vectors(route_points) * corridor.EARTH_RADIUS_KM
+
+def _segment_distances(xyz, start, stop):
+    # distance in kms from xyz[start+1:stop] to the chord xyz[start] -> xyz[stop]
+    a, b = xyz[start], xyz[stop]
+    pts = xyz[start + 1:stop]
+    ab = b - a
+    length_sq = ab @ ab
+    if length_sq == 0:
+        return np.linalg.norm(pts - a, axis=1)
+    t = np.clip((pts - a) @ ab / length_sq, 0.0, 1.0)
+    return np.linalg.norm(pts - (a + t[:, None] * ab), axis=1)
+
+def douglas_peucker(route_points, tolerance):
+    # boolean mask of the vertices to keep so that every dropped vertex lies within
+    # tolerance kms of the simplified line. chords through the earth sit inside the
+    # great-circle arcs, so measuring against them only ever keeps extra vertices.
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    keep = np.zeros(len(route_points), dtype=bool)
+    if len(route_points) <= 2:
+        keep[:] = True
+        return keep
+
+    xyz = _to_km_xyz(route_points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(route_points) - 1)]
+    while stack:
+        start, stop = stack.pop()
+        if stop - start < 2:
+            continue
+        dists = _segment_distances(xyz, start, stop)
+        farthest = int(dists.argmax())
+        if dists[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, stop))
+    return keep
+
+def simplify(route_points, tolerance):
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    return route_points[douglas_peucker(route_points, tolerance)]
+
+def corridor_tolerance(search_distance, ratio=CORRIDOR_ERROR_RATIO):
+    return search_distance * ratio
+
+def corridor_vertices(route_points, search_distance, ratio=CORRIDOR_ERROR_RATIO):
+    # indices of the route vertices the corridor search keeps; distances measured
+    # against them are within ratio * search_distance of those to the full route
+    return np.flatnonzero(douglas_peucker(route_points, corridor_tolerance(search_distance, ratio)))
+
+def display_tolerance(zoom, latitude=38.0, pixels=1.0):
+    # kms covered by `pixels` screen pixels at a web-mercator zoom level
+    meters_per_pixel = 156543.03392 * math.cos(math.radians(latitude)) / 2**zoom
+    return pixels * meters_per_pixel / 1000.0
+
+def for_display(route_points, zoom, pixels=1.0):
+    # geometry for drawing at `zoom`; dropped detail is under `pixels` on screen
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    if len(route_points) == 0:
+        return route_points
+    latitude = float(np.abs(route_points[:, 0]).max())
+    return simplify(route_points, display_tolerance(zoom, latitude, pixels))
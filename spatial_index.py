@@ -0,0 +1,157 @@
+import os
+import numpy as np
+import haversine
+from fileutil import atomic_write
+
+KM_PER_DEG_LAT = 111.0
+
+class GridIndex:
+    # bucket index over lat/lon cells of cell_deg degrees. points are stored sorted by
+    # cell key so each cell is a contiguous slice of `order`, found by binary search.
+    def __init__(self, lats, lons, cell_deg=0.5):
+        self.cell_deg = float(cell_deg)
+        self.n_cols = int(np.ceil(360.0 / self.cell_deg))
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+
+        keys = self._cell_keys(self.lats, self.lons)
+        self.order = np.argsort(keys, kind='stable')
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(
+            keys[self.order], return_index=True, return_counts=True)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _rows(self, lats):
+        return np.floor((np.asarray(lats) + 90.0) / self.cell_deg).astype(np.int64)
+
+    def _cols(self, lons):
+        return np.floor((np.asarray(lons) + 180.0) / self.cell_deg).astype(np.int64) % self.n_cols
+
+    def _cell_keys(self, lats, lons):
+        return self._rows(lats) * self.n_cols + self._cols(lons)
+
+    def _points_in_cells(self, keys):
+        keys = np.unique(keys)
+        pos = np.searchsorted(self.cell_keys, keys)
+        found = pos < len(self.cell_keys)
+        found[found] = self.cell_keys[pos[found]] == keys[found]
+        pos = pos[found]
+        if len(pos) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([
+            self.order[start:start + count]
+            for start, count in zip(self.cell_starts[pos], self.cell_counts[pos])
+        ]))
+
+    def _cells_around(self, lats, lons, radius):
+        # keys of every cell within radius kms of any of the given points
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        lat_offset = radius / KM_PER_DEG_LAT
+        lon_offset = radius / (KM_PER_DEG_LAT * np.maximum(np.cos(np.radians(np.abs(lats) + lat_offset)), 0.01))
+
+        row_min, row_max = self._rows(lats - lat_offset), self._rows(lats + lat_offset)
+        col_min = np.floor((lons - lon_offset + 180.0) / self.cell_deg).astype(np.int64)
+        col_max = np.floor((lons + lon_offset + 180.0) / self.cell_deg).astype(np.int64)
+
+        keys = []
+        for dr in range(int((row_max - row_min).max()) + 1):
+            for dc in range(int((col_max - col_min).max()) + 1):
+                hit = (row_min + dr <= row_max) & (col_min + dc <= col_max)
+                keys.append((row_min[hit] + dr) * self.n_cols + (col_min[hit] + dc) % self.n_cols)
+        return np.unique(np.concatenate(keys))
+
+    def query_radius(self, point, radius):
+        # indices of points within radius kms of point
+        lat, lon = point
+        candidates = self._points_in_cells(self._cells_around([lat], [lon], radius))
+        dists = haversine.haversine_matrix([point], np.c_[self.lats[candidates], self.lons[candidates]])[0]
+        return candidates[dists < radius]
+
+    def query_corridor(self, route_points, radius):
+        # indices of points in any cell within radius kms of the route. this is a
+        # candidate set: callers still measure the exact distance to the route.
+        route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+        if len(route_points) == 0 or len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+        step = self.cell_deg * KM_PER_DEG_LAT / 2
+        dense = densify(route_points, step=step)
+        # any point on a segment is within step / 2 of a densified point
+        return self._points_in_cells(self._cells_around(dense[:, 0], dense[:, 1], radius + step / 2))
+
+    def save(self, path, source_signature=None):
+        # written to a temp file and renamed into place, so a process loading the
+        # index while another one rebuilds it never reads a partial file
+        with atomic_write(path) as f:
+            self._savez(f, source_signature)
+
+    def _savez(self, f, source_signature):
+        np.savez(
+            f,
+            cell_deg=self.cell_deg,
+            lats=self.lats,
+            lons=self.lons,
+            order=self.order,
+            cell_keys=self.cell_keys,
+            cell_starts=self.cell_starts,
+            cell_counts=self.cell_counts,
+            source_signature=np.asarray(source_signature or [], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.cell_deg = float(data['cell_deg'])
+            index.n_cols = int(np.ceil(360.0 / index.cell_deg))
+            for name in ['lats', 'lons', 'order', 'cell_keys', 'cell_starts', 'cell_counts']:
+                setattr(index, name, data[name])
+            index.source_signature = data['source_signature'].tolist()
+        return index
+
+def densify(route_points, step):
+    # insert great-circle points so that no two consecutive points are more than
+    # step kms apart; cell lookups around vertices then cover the whole route
+    route_points = np.asarray(route_points, dtype=np.float64).reshape(-1, 2)
+    if len(route_points) < 2:
+        return route_points
+
+    lat, lon = np.radians(route_points[:, 0]), np.radians(route_points[:, 1])
+    xyz = np.c_[np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    seg_angles = np.arccos(np.clip((xyz[:-1] * xyz[1:]).sum(axis=1), -1.0, 1.0))
+    splits = np.maximum(np.ceil(seg_angles * 6371.0 / step).astype(np.int64), 1)
+
+    seg = np.repeat(np.arange(len(splits)), splits)
+    frac = (np.arange(len(seg)) - np.repeat(np.cumsum(splits) - splits, splits)) / splits[seg]
+    # slerp; near-zero segments fall back to the start vertex
+    sin_angle = np.sin(seg_angles[seg])
+    safe = sin_angle > 1e-12
+    w0 = np.where(safe, np.sin((1 - frac) * seg_angles[seg]) / np.where(safe, sin_angle, 1), 1 - frac)
+    w1 = np.where(safe, np.sin(frac * seg_angles[seg]) / np.where(safe, sin_angle, 1), frac)
+    pts = w0[:, None] * xyz[seg] + w1[:, None] * xyz[seg + 1]
+    pts = np.vstack([pts, xyz[-1:]])
+
+    dense_lat = np.degrees(np.arctan2(pts[:, 2], np.hypot(pts[:, 0], pts[:, 1])))
+    dense_lon = np.degrees(np.arctan2(pts[:, 1], pts[:, 0]))
+    return np.c_[dense_lat, dense_lon]
+
+def source_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def index_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.index.npz'
+
+def load_or_build_index(lats, lons, csv_path, cell_deg=0.5):
+    # reuse the index saved next to csv_path unless the csv changed since it was built
+    path = index_path_for(csv_path)
+    signature = source_signature(csv_path)
+    if os.path.exists(path):
+        index = GridIndex.load(path)
+        if index.source_signature == signature and len(index) == len(lats) and index.cell_deg == cell_deg:
+            return index
+
+    index = GridIndex(lats, lons, cell_deg=cell_deg)
+    index.save(path, source_signature=signature)
+    return index
@@ -0,0 +1,69 @@
+import pytest
+import cache
+import instrumentation
+from cache import LRUCache, DiskCache, TieredCache
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock.time)
+    return clock
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1  # a is now the most recent
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1 and lru.get('c') == 3
+    assert lru.stats() == {'hits': 3, 'misses': 1, 'entries': 2}
+
+def test_lru_ttl(clock):
+    lru = LRUCache(maxsize=10, ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2, ttl=600)
+    clock.now += 61
+    assert lru.get('a') is None
+    assert lru.get('b') == 2
+    assert len(lru) == 1
+
+def test_disk_ttl_and_purge(tmp_path, clock):
+    disk = DiskCache(str(tmp_path / 'cache.sqlite'), ttl=60)
+    disk.set('a', (1.0, 2.0))
+    disk.set('b', [1, 2], ttl=600)
+    assert disk.get('a') == (1.0, 2.0)
+    clock.now += 61
+    assert disk.get('a') is None
+    assert disk.get_many(['a', 'b', 'c']) == {'b': [1, 2]}
+    disk.set('c', 3)  # writes purge expired rows
+    with disk._connect() as conn:
+        assert [key for key, in conn.execute('SELECT key FROM cache ORDER BY key')] == ['b', 'c']
+    # a new DiskCache on the same file sees the same rows
+    assert DiskCache(str(tmp_path / 'cache.sqlite')).get('c') == 3
+
+def test_tiered_promotes_disk_hits(tmp_path):
+    disk = DiskCache(str(tmp_path / 'cache.sqlite'))
+    disk.set('route', [1, 2, 3])
+    tiered = TieredCache(LRUCache(maxsize=4), disk)
+
+    assert tiered.get('route') == [1, 2, 3]
+    assert tiered.get('route') == [1, 2, 3]
+    assert tiered.get('missing', 'default') == 'default'
+    assert tiered.stats() == {'memory_hits': 1, 'disk_hits': 1, 'misses': 1, 'memory_entries': 1}
+
+def test_registered_cache_stats_are_in_the_metrics(tmp_path):
+    metrics = instrumentation.Metrics()
+    lru = LRUCache()
+    lru.get('a')
+    metrics.register_cache('route_result', lru)
+    text = metrics.prometheus_text()
+    assert 'ddd_cache_stats{cache="route_result",stat="misses"} 1' in text
+    assert 'ddd_cache_stats{cache="route_result",stat="entries"} 0' in text
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import corridor
+import haversine
+import spatial_index
+from route_fixtures import ROUTES, synthetic_route
+
+def locations_near(route, n=3000, spread=1.5, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = route[rng.integers(0, len(route), n)]
+    return picks + rng.normal(0.0, spread / 2, picks.shape)
+
+@pytest.mark.parametrize('n_tiles', range(1, 8))
+@pytest.mark.parametrize('name', ['regional', 'coast_to_coast'])
+def test_tiled_search_equals_corridor_search(name, n_tiles):
+    route = synthetic_route(ROUTES[name], step=5.0)
+    locations = locations_near(route)
+
+    dists, route_km = corridor.corridor_search(route, locations, 50)
+    tiled_dists, tiled_km = corridor.tiled_corridor_search(route, locations, 50, n_tiles=n_tiles)
+
+    assert np.array_equal(np.isfinite(dists), np.isfinite(tiled_dists))
+    found = np.isfinite(dists)
+    assert found.any()
+    assert np.allclose(tiled_dists[found], dists[found])
+    assert np.allclose(tiled_km[found], route_km[found])
+    assert np.all(np.isnan(tiled_km[~found]))
+
+def brute_force(route, locations, step=0.02):
+    # distance to the closest point of the route sampled every step kms, and that
+    # point's km along the route
+    dense = spatial_index.densify(route, step)
+    dense_km = np.concatenate([[0.0], np.cumsum(corridor.segment_lengths(dense))])
+    dists = np.full(len(locations), np.inf)
+    route_km = np.full(len(locations), np.nan)
+    for start in range(0, len(dense), 5000):
+        d = haversine.haversine_matrix(dense[start:start + 5000], locations)
+        best = d.argmin(axis=0)
+        chunk_min = d[best, np.arange(len(locations))]
+        closer = chunk_min < dists
+        dists[closer] = chunk_min[closer]
+        route_km[closer] = dense_km[start + best[closer]]
+    return dists, route_km
+
+@pytest.mark.parametrize('name', ['city_hop', 'regional'])
+def test_corridor_search_matches_brute_force(name):
+    route = synthetic_route(ROUTES[name], step=5.0)
+    locations = locations_near(route, n=300, spread=0.5)
+
+    dists, route_km = corridor.corridor_search(route, locations)
+    brute_dists, brute_km = brute_force(route, locations)
+
+    # within 10 m of a 20 m sampling of the route, and never further than it
+    assert np.all(np.abs(dists - brute_dists) < 0.01)
+    assert np.all(dists <= brute_dists + 1e-9)
+    # route_km is where the closest point is: the route there is dists away
+    dense = spatial_index.densify(route, 0.02)
+    dense_km = np.concatenate([[0.0], np.cumsum(corridor.segment_lengths(dense))])
+    at = np.c_[np.interp(route_km, dense_km, dense[:, 0]), np.interp(route_km, dense_km, dense[:, 1])]
+    reached = np.array([haversine.haversine_distance(a, b) for a, b in zip(at, locations)])
+    assert np.all(np.abs(reached - dists) < 0.02)
+
+@pytest.mark.parametrize('max_distance', [1, 20, 120])
+@pytest.mark.parametrize('name', ['city_hop', 'regional', 'coast_to_coast'])
+def test_max_distance_cut_keeps_everything_inside(name, max_distance):
+    route = synthetic_route(ROUTES[name], step=5.0)
+    locations = locations_near(route, n=2000, spread=max_distance / 50)
+
+    dists, route_km = corridor.corridor_search(route, locations)
+    cut_dists, cut_km = corridor.corridor_search(route, locations, max_distance, block_size=16)
+
+    inside = dists <= max_distance
+    assert inside.any() and (~inside).any()
+    assert np.allclose(cut_dists[inside], dists[inside])
+    assert np.allclose(cut_km[inside], route_km[inside])
+    assert np.all(np.isinf(cut_dists[~inside]))
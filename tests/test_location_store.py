@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import location_store
+
+def test_code_dtype_widens_past_uint16():
+    assert location_store.code_dtype(3) == 'u2'
+    assert location_store.code_dtype(65536) == 'u2'
+    assert location_store.code_dtype(65537) == 'u4'
+
+def test_many_cities_keep_their_own_codes():
+    n = 70_000
+    ddds = pd.DataFrame({
+        'loc_name': ['x'] * n,
+        'city': [f'city {i}' for i in range(n)],
+        'state': ['CA'] * n,
+        'latitude': np.zeros(n),
+        'longitude': np.zeros(n),
+    })
+    table = location_store.LocationTable(*location_store.to_records(ddds))
+    rows = table.rows([0, n - 1])
+    assert list(rows['city']) == ['city 0', f'city {n - 1}']
+
+def write_csv(path, states):
+    pd.DataFrame({
+        'loc_name': [f'stop {i}' for i in range(len(states))],
+        'city': ['springfield'] * len(states),
+        'state': states,
+        'latitude': np.linspace(30, 40, len(states)),
+        'longitude': np.linspace(-100, -90, len(states)),
+    }).to_csv(path, index=False)
+
+def test_records_are_never_paired_with_another_builds_categories(tmp_path, monkeypatch):
+    monkeypatch.setattr(location_store.time, 'sleep', lambda seconds: None)
+    csv_path = str(tmp_path / 'ddds.csv')
+    write_csv(csv_path, ['AL', 'CA', 'NY'])
+    location_store.build_store(csv_path)
+
+    # another process has renamed its new records into place but not yet its
+    # categories: the codes now index ['AK', 'AL', 'CA', 'NY']
+    write_csv(csv_path, ['AK', 'AL', 'CA', 'NY'])
+    records, _ = location_store.to_records(location_store.clean_ddds(csv_path))
+    with location_store.atomic_write(location_store.store_path_for(csv_path)) as f:
+        np.save(f, records)
+
+    table = location_store.LocationTable(*location_store.load_records(csv_path))
+    assert list(table.rows()['state']) == ['AK', 'AL', 'CA', 'NY']
+
+def test_store_round_trips(tmp_path):
+    csv_path = str(tmp_path / 'ddds.csv')
+    write_csv(csv_path, ['NY', 'AL', 'NY'])
+    records, categories = location_store.load_records(csv_path)
+    assert categories == {'state': ['AL', 'NY'], 'city': ['springfield']}
+    assert list(location_store.LocationTable(records, categories).rows()['state']) == ['NY', 'AL', 'NY']
+    assert not location_store.store_is_stale(csv_path)
@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import pandas as pd
+import planner
+import location_store
+
+ROUTE = np.c_[np.full(200, 35.0), np.linspace(-100.0, -95.0, 200)]
+
+def write_csv(path, stops):
+    pd.DataFrame({
+        'loc_name': [name for name, _, _ in stops],
+        'city': ['springfield'] * len(stops),
+        'state': ['OK'] * len(stops),
+        'full_address': [f'{i} main st' for i in range(len(stops))],
+        'latitude': [lat for _, lat, _ in stops],
+        'longitude': [lon for _, _, lon in stops],
+    }).to_csv(path, index=False)
+
+def search(csv_path, route_points, search_distance):
+    table, index = location_store.load_ddds(csv_path)
+    matches = planner.find_ddds_along_route(
+        table, route_points, planner.calc_filter_window(route_points, search_distance), search_distance, index)
+    return sorted(matches.frame()['loc_name'])
+
+def test_rebuilt_csv_invalidates_cached_results(tmp_path):
+    planner.result_cache.clear()
+    csv_path = str(tmp_path / 'ddds.csv')
+    write_csv(csv_path, [('on route', 35.1, -98.0), ('far away', 45.0, -70.0)])
+    assert search(csv_path, ROUTE, 50) == ['on route']
+
+    misses = planner.result_cache.misses
+    assert search(csv_path, ROUTE, 50) == ['on route']
+    assert planner.result_cache.misses == misses
+
+    # a different radius or geometry is a different search
+    assert search(csv_path, ROUTE, 20) == ['on route']
+    assert search(csv_path, ROUTE + [0.0, 0.1], 50) == ['on route']
+    assert planner.result_cache.misses == misses + 2
+
+    # rebuild the dataset with a new stop by the route; the old table's results must not be reused
+    stat = os.stat(csv_path)
+    write_csv(csv_path, [('on route', 35.1, -98.0), ('far away', 45.0, -70.0), ('new stop', 34.9, -96.0)])
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert search(csv_path, ROUTE, 50) == ['new stop', 'on route']
+    assert planner.result_cache.misses == misses + 3
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import polyline
+from bench_polyline import legacy_decode_polyline
+
+# the worked example from google's polyline format docs
+GOOGLE_EXAMPLE = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+GOOGLE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+
+def random_route(n, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.array([[rng.uniform(-80, 80), rng.uniform(-179, 179)]])
+    return np.round(start + rng.normal(0.0, 0.05, (n, 2)).cumsum(axis=0), 5)
+
+def test_google_example():
+    assert polyline.encode(GOOGLE_POINTS) == GOOGLE_EXAMPLE
+    assert np.allclose(polyline.decode(GOOGLE_EXAMPLE), GOOGLE_POINTS)
+
+@pytest.mark.parametrize('n', [1, 2, 10, 5000])
+def test_round_trip(n):
+    route = random_route(n, seed=n)
+    encoded = polyline.encode(route)
+    assert np.allclose(polyline.decode(encoded), route)
+    assert np.allclose(polyline.decode(encoded), legacy_decode_polyline(encoded))
+
+def test_empty():
+    assert polyline.encode([]) == ''
+    assert polyline.decode('').shape == (0, 2)
+    assert polyline.decode_many([]) == []
+
+def test_decode_many_matches_decode_with_empty_strings():
+    routes = [random_route(n, seed=n) for n in (3, 0, 7, 0, 1)]
+    encoded = [polyline.encode(route) for route in routes]
+    assert '' in encoded
+    decoded = polyline.decode_many(encoded)
+    assert len(decoded) == len(routes)
+    for points, route in zip(decoded, routes):
+        assert points.shape == (len(route), 2)
+        assert np.allclose(points, route.reshape(-1, 2))
+
+def test_truncated_polyline_is_rejected():
+    with pytest.raises(ValueError):
+        polyline.decode(GOOGLE_EXAMPLE[:-1])
@@ -0,0 +1,139 @@
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+import pytest
+import google_apis
+import scrape_ddd_locations as scrape
+
+def location_html(name, address, city, state, zip_code):
+    return (f'<td><a href="{name.lower()}.html"><u>{name}</u></a><font>menu</font>'
+            f'<font>{address}<br/><b>{city}</b>, {state} {zip_code}</font></td>')
+
+def state_page(rows):
+    return ('<html><body><center><table><tr>' + ''.join(location_html(*row) for row in rows) +
+            '</tr></table></center></body></html>').encode('utf-8')
+
+class FakeResponse:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+class FakeSite:
+    # state pages by url; pages in `etags` answer conditional requests with 304
+    def __init__(self, pages, etags=()):
+        self.pages = dict(pages)
+        self.etags = set(etags)
+        self.requests = []
+
+    def fetch(self, url, session=None, throttle=None, validators=None):
+        self.requests.append((url, validators))
+        content = self.pages[url]
+        etag = hashlib.md5(content).hexdigest() if url in self.etags else None
+        if etag and validators and validators.get('etag') == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, content, {'ETag': etag} if etag else {})
+
+PAGES = {
+    'https://ddd.test/alabama': [('Panini', '42 Section St.', 'Fairhope', 'AL', '36526'),
+                                 ('Dreamland', '5535 15th Ave', 'Tuscaloosa', 'AL', '35405')],
+    'https://ddd.test/arizona': [('Welcome Diner', '929 E Pierce St', 'Phoenix', 'AZ', '85006')],
+    'https://ddd.test/california': [('Oinkster', '2005 Colorado Blvd', 'Los Angeles', 'CA', '90041')],
+}
+
+@pytest.fixture
+def site(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # the geocode cache is written to the working directory
+    site = FakeSite({url: state_page(rows) for url, rows in PAGES.items()}, etags=['https://ddd.test/alabama'])
+    monkeypatch.setattr(scrape, 'fetch_state_page', site.fetch)
+
+    site.parsed = []
+    parse_state_page = scrape.parse_state_page
+    def counting_parse(content):
+        site.parsed.append(content)
+        return parse_state_page(content)
+    monkeypatch.setattr(scrape, 'parse_state_page', counting_parse)
+
+    site.geocoded = []
+    def get_lat_lon(address):
+        site.geocoded.append(address)
+        digest = hashlib.sha256(address.encode('utf-8')).digest()
+        return 30 + digest[0] / 16, -120 + digest[1] / 8
+    monkeypatch.setattr(google_apis, 'get_lat_lon', get_lat_lon)
+    return site
+
+def refresh(tmp_path, workers=1):
+    return scrape.refresh_dataset(str(tmp_path / 'ddd.csv'), str(tmp_path / 'manifest.json'),
+                                  list(PAGES), workers=workers, geocode_workers=1, geocode_interval=0)
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_refresh_only_reparses_and_geocodes_what_changed(site, tmp_path, workers):
+    first = refresh(tmp_path, workers)
+    assert len(site.parsed) == 3
+    assert sorted(site.geocoded) == sorted(first['full_address'])
+    manifest = scrape.load_manifest(str(tmp_path / 'manifest.json'))
+    assert set(manifest) == set(PAGES)
+    assert all(entry['keys'] for entry in manifest.values())
+
+    # alabama is unchanged and answers 304, arizona is unchanged without an etag,
+    # california moved one place and gained another
+    site.parsed.clear()
+    site.geocoded.clear()
+    site.pages['https://ddd.test/california'] = state_page([
+        ('Oinkster', '2100 Colorado Blvd', 'Los Angeles', 'CA', '90041'),
+        ('Brent\'s Deli', '19565 Parthenia St', 'Northridge', 'CA', '91324'),
+    ])
+    second = refresh(tmp_path, workers)
+
+    assert site.parsed == [site.pages['https://ddd.test/california']]
+    assert sorted(site.geocoded) == ['19565 Parthenia St, Northridge, CA 91324', '2100 Colorado Blvd, Los Angeles, CA 90041']
+    alabama_requests = [validators for url, validators in site.requests if url == 'https://ddd.test/alabama']
+    assert alabama_requests[-1]['etag']
+
+    # unchanged rows keep their coordinates; the csv and manifest round trip
+    assert list(second['loc_name']) == ['Panini', 'Dreamland', 'Welcome Diner', 'Oinkster', 'Brent\'s Deli']
+    kept = first.set_index('full_address').loc[second['full_address'][:3]]
+    assert np.allclose(second[['latitude', 'longitude']][:3].to_numpy(), kept[['latitude', 'longitude']].to_numpy())
+    written = pd.read_csv(tmp_path / 'ddd.csv', dtype={'zip': str})
+    pd.testing.assert_frame_equal(written, second.astype({'zip': str}), check_dtype=False)
+    manifest = scrape.load_manifest(str(tmp_path / 'manifest.json'))
+    site_url = 'https://www.dinersdriveinsdiveslocations.com/'
+    assert manifest['https://ddd.test/california']['keys'] == [site_url + 'oinkster.html', site_url + 'brent\'s deli.html']
+    assert manifest['https://ddd.test/alabama']['keys'] == [site_url + 'panini.html', site_url + 'dreamland.html']
+
+def test_page_with_rows_missing_from_the_csv_is_fetched_again(site, tmp_path):
+    refresh(tmp_path)
+    # a row dropped from the csv can't be carried over, so alabama is requested
+    # without validators and parsed again even though it hasn't changed
+    csv = pd.read_csv(tmp_path / 'ddd.csv', dtype=str)
+    csv[csv['loc_name'] != 'Dreamland'].to_csv(tmp_path / 'ddd.csv', index=False)
+    site.parsed.clear()
+    site.requests.clear()
+
+    again = refresh(tmp_path)
+
+    assert site.parsed == [site.pages['https://ddd.test/alabama']]
+    assert dict(site.requests)['https://ddd.test/alabama'] is None
+    assert 'Dreamland' in set(again['loc_name'])
+    # its address is in the geocode cache, so it isn't looked up again
+    assert site.geocoded.count('5535 15th Ave, Tuscaloosa, AL 35405') == 1
+    assert not np.isnan(again.loc[again['loc_name'] == 'Dreamland', 'latitude']).any()
+
+def test_threaded_map_keeps_state_order():
+    urls = [f'https://ddd.test/state{i}' for i in range(8)]
+    finished = []
+
+    def func(url):
+        # later urls finish first
+        i = urls.index(url)
+        time.sleep(0.01 * (len(urls) - i))
+        finished.append(url)
+        return [{'name': url, 'n': i}]
+
+    serial = scrape.map_state_urls(func, urls, workers=1)
+    finished.clear()
+    threaded = scrape.map_state_urls(func, urls, workers=4)
+
+    assert finished != urls
+    assert threaded == serial
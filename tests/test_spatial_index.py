@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import corridor
+import haversine
+import spatial_index
+from route_fixtures import ROUTES, synthetic_route
+
+def points_around(route, n=5000, spread=1.5, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = route[rng.integers(0, len(route), n)]
+    return picks + rng.normal(0.0, spread, picks.shape)
+
+@pytest.mark.parametrize('radius', [1, 20, 120])
+@pytest.mark.parametrize('name', list(ROUTES))
+def test_query_corridor_never_misses_a_point_inside_the_radius(name, radius):
+    route = synthetic_route(ROUTES[name])
+    points = points_around(route, spread=radius / 60)
+    index = spatial_index.GridIndex(points[:, 0], points[:, 1])
+
+    dists, _ = corridor.corridor_search(route, points)
+    inside = np.flatnonzero(dists <= radius)
+    candidates = index.query_corridor(route, radius)
+    assert len(inside) > 0
+    assert np.all(np.isin(inside, candidates))
+
+@pytest.mark.parametrize('radius', [1, 20, 120, 500])
+@pytest.mark.parametrize('center', [(38.0, -97.0), (47.6, -122.3), (64.8, -147.7), (21.3, 179.9)])
+def test_query_radius_matches_haversine(center, radius):
+    rng = np.random.default_rng(1)
+    spread = radius / 111.0 * 1.5
+    lats = np.clip(center[0] + rng.uniform(-spread, spread, 5000), -89.9, 89.9)
+    lons = (center[1] + rng.uniform(-3 * spread, 3 * spread, 5000) + 180.0) % 360.0 - 180.0
+    index = spatial_index.GridIndex(lats, lons)
+
+    expected = np.flatnonzero(haversine.haversine_matrix([center], np.c_[lats, lons])[0] < radius)
+    assert len(expected) > 0
+    assert np.array_equal(np.sort(index.query_radius(center, radius)), expected)
+
+def test_save_writes_atomically_and_loads_back(tmp_path):
+    rng = np.random.default_rng(0)
+    index = spatial_index.GridIndex(rng.uniform(25, 49, 500), rng.uniform(-124, -70, 500))
+    path = tmp_path / 'ddd_locations.index.npz'
+    index.save(str(path), source_signature=[1, 2])
+
+    # no temp file is left next to it
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+    loaded = spatial_index.GridIndex.load(str(path))
+    assert loaded.source_signature == [1, 2]
+    assert np.array_equal(loaded.order, index.order)
+    assert np.array_equal(loaded.query_radius((38.0, -97.0), 500), index.query_radius((38.0, -97.0), 500))
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+import planner
+import location_store
+import spatial_index
+
+def make_table(n=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    ddds = pd.DataFrame({
+        'loc_name': [f'stop {i}' for i in range(n)],
+        'city': rng.choice(['a', 'b', 'c'], n),
+        'state': rng.choice(['AL', 'CA', 'NY'], n),
+        'full_address': [f'{i} main st' for i in range(n)],
+        'latitude': rng.uniform(25, 49, n),
+        'longitude': rng.uniform(-124, -70, n),
+    })
+    table = location_store.LocationTable(*location_store.to_records(ddds))
+    return table, spatial_index.GridIndex(table.latitude, table.longitude)
+
+def make_route(waypoints, n=3000, seed=1):
+    rng = np.random.default_rng(seed)
+    waypoints = np.asarray(waypoints, dtype=np.float64)
+    t = np.linspace(0, len(waypoints) - 1, n)
+    route = np.c_[np.interp(t, np.arange(len(waypoints)), waypoints[:, 0]),
+                  np.interp(t, np.arange(len(waypoints)), waypoints[:, 1])]
+    return route + rng.normal(0, 0.02, route.shape)
+
+ROUTES = {
+    'short': [(34.0, -118.2), (34.4, -117.6)],
+    'long': [(47.6, -122.3), (39.7, -105.0), (41.9, -87.6), (40.7, -74.0)],
+}
+
+def assert_same(joined, expected):
+    assert len(joined) == len(expected)
+    order, expected_order = np.argsort(joined.rows), np.argsort(expected.rows)
+    assert np.array_equal(joined.rows[order], expected.rows[expected_order])
+    assert np.allclose(joined.range[order], expected.range[expected_order])
+    assert np.allclose(joined.route_km[order], expected.route_km[expected_order])
+    assert joined.total_km == pytest.approx(expected.total_km)
+
+@pytest.mark.parametrize('workers', [1, 4])
+@pytest.mark.parametrize('use_index', [True, False])
+@pytest.mark.parametrize('name', list(ROUTES))
+def test_stream_joins_to_find_ddds_along_route(monkeypatch, workers, use_index, name):
+    monkeypatch.setattr(planner, 'CORRIDOR_WORKERS', workers)
+    table, index = make_table()
+    index = index if use_index else None
+    route = make_route(ROUTES[name])
+    search_distance = 30
+
+    batches = list(planner.stream_ddds_along_route(table, route, search_distance, index, stretch_km=100))
+    expected = planner.find_ddds_along_route(
+        table, route, planner.calc_filter_window(route, search_distance), search_distance, index)
+
+    assert_same(planner.join_matches(batches).within(search_distance), expected)
+    # batches come in route order
+    route_km = np.concatenate([batch.route_km for batch in batches])
+    assert np.all(np.diff(route_km) >= 0)
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_unsimplified_stream_joins_to_route_distance_field(monkeypatch, workers):
+    monkeypatch.setattr(planner, 'CORRIDOR_WORKERS', workers)
+    table, index = make_table()
+    route = make_route(ROUTES['long'])
+
+    batches = list(planner.stream_ddds_along_route(
+        table, route, planner.MAX_SEARCH_DISTANCE, index, simplified=False, stretch_km=100))
+
+    assert len(batches) > 1
+    assert_same(planner.join_matches(batches), planner.route_distance_field(table, route, planner.MAX_SEARCH_DISTANCE, index))